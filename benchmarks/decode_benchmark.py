@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Image Decode Benchmark
+Compares full-resolution decoding against reduced-resolution (draft) decoding
+for large photos, measuring the per-image cost of getting a 224px CLIP input
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import statistics
+import tempfile
+from typing import Dict, List
+import numpy as np
+from PIL import Image
+
+# Add server directory to path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from services.image_loading import open_image, TARGET_SIZE
+
+# Typical camera resolutions (width, height)
+PHOTO_SIZES = [
+    (1920, 1080),   # 2 MP
+    (4032, 3024),   # 12 MP phone
+    (6000, 4000),   # 24 MP camera
+]
+
+
+def resize_and_crop(image: Image.Image, size: int = TARGET_SIZE) -> Image.Image:
+    """Same geometry as the open_clip transform: bicubic shortest-side resize + center crop"""
+    image = image.convert("RGB")
+    width, height = image.size
+    scale = size / min(width, height)
+    new_size = (max(size, round(width * scale)), max(size, round(height * scale)))
+    image = image.resize(new_size, Image.BICUBIC)
+    left = (new_size[0] - size) // 2
+    top = (new_size[1] - size) // 2
+    return image.crop((left, top, left + size, top + size))
+
+
+def full_decode(path: str) -> Image.Image:
+    return resize_and_crop(Image.open(path))
+
+
+def draft_decode(path: str) -> Image.Image:
+    return resize_and_crop(open_image(path))
+
+
+class DecodeBenchmark:
+    def __init__(self):
+        self.temp_dirs = []
+
+    def cleanup(self):
+        """Clean up temporary directories"""
+        for temp_dir in self.temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def create_test_photos(self, size: tuple, count: int) -> List[str]:
+        """Create photo-like JPEGs (smooth gradients plus noise) of the given size"""
+        temp_dir = tempfile.mkdtemp(prefix="img_decode_bench_")
+        self.temp_dirs.append(temp_dir)
+
+        width, height = size
+        paths = []
+        for i in range(count):
+            x = np.linspace(0, 255, width, dtype=np.float32)
+            y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+            base = np.stack([x + 0 * y, y + 0 * x, (x + y + i * 40) % 255], axis=-1)
+            noise = np.random.normal(0, 12, base.shape)
+            img_array = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+            path = os.path.join(temp_dir, f"photo_{i:03d}.jpg")
+            Image.fromarray(img_array).save(path, quality=90)
+            paths.append(path)
+        return paths
+
+    def time_loader(self, loader, paths: List[str], rounds: int) -> List[float]:
+        timings = []
+        for _ in range(rounds):
+            for path in paths:
+                start = time.perf_counter()
+                loader(path)
+                timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def run_benchmark(self, count: int = 5, rounds: int = 3) -> Dict:
+        print("🏃‍♂️ Running image decode benchmark...")
+        results = []
+
+        for size in PHOTO_SIZES:
+            megapixels = size[0] * size[1] / 1_000_000
+            print(f"\n🧪 {size[0]}x{size[1]} ({megapixels:.0f} MP), {count} images")
+            paths = self.create_test_photos(size, count)
+
+            # Warm the OS page cache so both loaders read from memory
+            self.time_loader(full_decode, paths, 1)
+
+            full_ms = self.time_loader(full_decode, paths, rounds)
+            draft_ms = self.time_loader(draft_decode, paths, rounds)
+
+            # How far the reduced decode drifts from the full decode
+            diff = np.abs(
+                np.asarray(full_decode(paths[0]), dtype=np.float32) -
+                np.asarray(draft_decode(paths[0]), dtype=np.float32)
+            )
+
+            result = {
+                "resolution": f"{size[0]}x{size[1]}",
+                "megapixels": megapixels,
+                "full_decode_ms": statistics.mean(full_ms),
+                "draft_decode_ms": statistics.mean(draft_ms),
+                "speedup": statistics.mean(full_ms) / statistics.mean(draft_ms),
+                "mean_abs_pixel_diff": float(diff.mean()),
+            }
+            results.append(result)
+            print(f"   Full decode:  {result['full_decode_ms']:.1f} ms/image")
+            print(f"   Draft decode: {result['draft_decode_ms']:.1f} ms/image")
+            print(f"   Speedup: {result['speedup']:.1f}x (mean pixel diff {result['mean_abs_pixel_diff']:.2f}/255)")
+
+        return {"individual_results": results}
+
+    def print_results(self, results: Dict):
+        print("\n" + "="*60)
+        print("🖼️  IMAGE DECODE BENCHMARK RESULTS")
+        print("="*60)
+        for r in results["individual_results"]:
+            print(f"   • {r['resolution']}: {r['full_decode_ms']:.1f} ms → {r['draft_decode_ms']:.1f} ms "
+                  f"({r['speedup']:.1f}x faster)")
+
+
+def main():
+    benchmark = DecodeBenchmark()
+
+    try:
+        results = benchmark.run_benchmark()
+        benchmark.print_results(results)
+
+        with open("decode_benchmark_results.json", "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"\n💾 Detailed results saved to: decode_benchmark_results.json")
+
+    finally:
+        benchmark.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Batch Preprocessing Benchmark
+Checks that the batched preprocessor matches the open_clip transform and
+measures per-image vs batched preprocessing throughput
+"""
+
+import os
+import sys
+import time
+import json
+from typing import Dict, List
+import numpy as np
+import torch
+import open_clip
+from PIL import Image
+
+# Add server directory to path to import modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'server'))
+
+from services.preprocessing import BatchPreprocessor
+
+MODEL_NAME = 'ViT-B-32'
+
+
+def create_test_images(count: int) -> List[Image.Image]:
+    """Random images with varied sizes, aspect ratios and modes"""
+    rng = np.random.default_rng(0)
+    images = []
+    sizes = [(640, 480), (480, 640), (224, 224), (1000, 300), (300, 1000), (513, 257)]
+    modes = ['RGB', 'RGB', 'L', 'RGBA', 'P']
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        img_array = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        image = Image.fromarray(img_array)
+        mode = modes[i % len(modes)]
+        if mode == 'P':
+            image = image.quantize()
+        elif mode != 'RGB':
+            image = image.convert(mode)
+        images.append(image)
+    return images
+
+
+class PreprocessBenchmark:
+    def __init__(self):
+        _, _, self.preprocess = open_clip.create_model_and_transforms(MODEL_NAME, pretrained=None)
+        self.batch_preprocess = BatchPreprocessor.from_transform(self.preprocess)
+
+    def check_equivalence(self, images: List[Image.Image]) -> Dict:
+        """Compare batched output against the per-image transform"""
+        expected = torch.stack([self.preprocess(img) for img in images])
+        actual = self.batch_preprocess([self.batch_preprocess.prepare(img) for img in images])
+        max_abs_diff = (expected - actual).abs().max().item()
+        return {
+            "images": len(images),
+            "max_abs_diff": max_abs_diff,
+            "exact_match": bool(torch.equal(expected, actual)),
+            "allclose": bool(torch.allclose(expected, actual, atol=1e-6)),
+        }
+
+    def measure_throughput(self, images: List[Image.Image], batch_size: int, rounds: int) -> Dict:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for i in range(0, len(images), batch_size):
+                torch.stack([self.preprocess(img) for img in images[i:i + batch_size]])
+        per_image_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for i in range(0, len(images), batch_size):
+                self.batch_preprocess([self.batch_preprocess.prepare(img) for img in images[i:i + batch_size]])
+        batched_time = time.perf_counter() - start
+
+        total = len(images) * rounds
+        return {
+            "batch_size": batch_size,
+            "per_image_images_per_second": total / per_image_time,
+            "batched_images_per_second": total / batched_time,
+            "speedup": per_image_time / batched_time,
+        }
+
+
+def main():
+    benchmark = PreprocessBenchmark()
+    images = create_test_images(64)
+
+    print("🔬 Checking batched preprocessing against open_clip transform...")
+    equivalence = benchmark.check_equivalence(images)
+    print(f"   Max abs diff: {equivalence['max_abs_diff']:.2e} "
+          f"(exact match: {equivalence['exact_match']})")
+
+    print("\n⚡ Measuring preprocessing throughput...")
+    throughput = benchmark.measure_throughput(images, batch_size=32, rounds=5)
+    print(f"   Per-image transform: {throughput['per_image_images_per_second']:.1f} images/second")
+    print(f"   Batched transform:   {throughput['batched_images_per_second']:.1f} images/second")
+    print(f"   Speedup: {throughput['speedup']:.2f}x")
+
+    with open("preprocess_benchmark_results.json", "w") as f:
+        json.dump({"equivalence": equivalence, "throughput": throughput}, f, indent=2)
+    print(f"\n💾 Detailed results saved to: preprocess_benchmark_results.json")
+
+    if not equivalence["allclose"]:
+        print("❌ Batched output does not match the open_clip transform")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
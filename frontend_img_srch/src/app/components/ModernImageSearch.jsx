@@ -404,7 +404,7 @@ const ImageSearch = () => {
                   )}
                   
                   <img
-                    src={result.full_url}
+                    src={result.thumbnail_url || result.full_url}
                     alt={`Search result ${index + 1}`}
                     className={`w-full h-52 object-cover transition-all duration-500 ${loadedImages[index] ? 'opacity-100' : 'opacity-0'}`}
                     onLoad={() => handleImageLoad(index)}
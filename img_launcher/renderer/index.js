@@ -153,7 +153,7 @@ function displayResults(items) {
 
   resultsDiv.innerHTML = items.map(item => `
     <div class="result" data-path="${item.path}">
-      <img src="${item.full_url}" alt="" />
+      <img src="${item.thumbnail_url || item.full_url}" alt="" />
       <div class="caption">${(item.score * 100).toFixed(1)}%</div>
     </div>
   `).join('');
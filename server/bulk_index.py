@@ -0,0 +1,256 @@
+# server/bulk_index.py
+"""
+Offline bulk indexer.
+
+Builds or updates embeddings/embeddings.db for one or more folders without
+going through the API, using worker processes on every core. Safe to run
+while the server is up: SQLite's WAL mode lets both write, the server reads
+the new rows on its next search, and the two never resume each other's jobs.
+
+    python bulk_index.py ~/Pictures /mnt/archive --workers 8
+    python bulk_index.py /mnt/archive --resume
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import psutil
+import torch
+
+from services.autotune import DEFAULT_BATCH_SIZE
+from services.clip_model import MODEL_ID, default_device, load_model
+from services.database import EmbeddingStore
+from services.pipeline import BisectingEncoder, DecodeStage, EmbeddingWriter, IndexingPipeline
+from services.scanner import TreeCache
+from services.thumbnails import ThumbnailCache
+from services.throttle import lower_thread_priority
+
+# Rough resident size of one worker with its model loaded
+WORKER_MEMORY_BYTES = 1024 ** 3
+
+# Decode threads inside each worker process
+DECODE_THREADS = 2
+
+# Chunks in flight per worker, so a worker never waits for the scanner
+CHUNKS_PER_WORKER = 2
+
+CHECKPOINT_EVERY_CHUNKS = 20
+REPORT_INTERVAL = 2.0
+
+_worker = {}
+
+
+def default_workers() -> int:
+    if default_device() == "cuda":
+        return 1
+    by_memory = psutil.virtual_memory().available // WORKER_MEMORY_BYTES
+    return max(1, min(os.cpu_count() or 1, int(by_memory)))
+
+
+def _init_worker(torch_threads: int, thumbnail_dir: str):
+    lower_thread_priority()
+    torch.set_num_threads(torch_threads)
+    device = default_device()
+    model, preprocess, _ = load_model(device)
+    _worker.update(model=model, device=device, preprocess=preprocess,
+                   thumbnails=ThumbnailCache(Path(thumbnail_dir)))
+
+
+def _encode_images(batch_tensor: torch.Tensor) -> np.ndarray:
+    with torch.no_grad():
+        return _worker["model"].encode_image(batch_tensor.to(_worker["device"])).cpu().numpy()
+
+
+def _encode_chunk(file_paths: List[str], file_hashes: List[Optional[str]]):
+    """Decode and encode one chunk in a worker; failures go back as plain tuples."""
+    failures = []
+    decoder = DecodeStage(
+        _worker["preprocess"], workers=DECODE_THREADS, thumbnails=_worker["thumbnails"],
+        on_error=lambda path, e: failures.append((path, "decode", type(e).__name__, str(e))),
+        metadata={path: (None, file_hash) for path, file_hash in zip(file_paths, file_hashes)},
+    )
+    encoder = BisectingEncoder(
+        _encode_images,
+        on_failure=lambda path, e: failures.append((path, "encode", type(e).__name__, str(e))),
+    )
+    paths = []
+    embeddings = []
+    for batch_paths, batch_tensor in decoder.batches(file_paths, len(file_paths)):
+        encoded_paths, encoded = encoder(batch_paths, batch_tensor)
+        if encoded_paths:
+            paths.extend(encoded_paths)
+            embeddings.append(encoded)
+    return paths, (np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)), failures
+
+
+def _chunks(file_paths: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for file_path in file_paths:
+        chunk.append(file_path)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _resumable_job(store: EmbeddingStore, folder_path: str) -> Optional[dict]:
+    for job in store.list_jobs(limit=1000):
+        if job["source"] != "cli":
+            continue
+        if job["folder_path"] == folder_path and job["state"] in ("interrupted", "running", "failed"):
+            return job
+        if job["folder_path"] == folder_path and job["state"] == "completed":
+            return None
+    return None
+
+
+class ThroughputReport:
+    def __init__(self, stats: dict, writer: EmbeddingWriter):
+        self.stats = stats
+        self.writer = writer
+        self.start_time = time.time()
+        self.last_report = 0.0
+
+    def line(self) -> str:
+        elapsed = time.time() - self.start_time
+        encoded = self.writer.indexed_count
+        return (f"scanned {self.stats.get('scanned', 0)} | queued {self.stats.get('queued', 0)} | "
+                f"encoded {encoded} | reused {self.stats.get('reused', 0)} | "
+                f"{encoded / elapsed if elapsed > 0 else 0:.1f} images/s")
+
+    def maybe_print(self):
+        if time.time() - self.last_report >= REPORT_INTERVAL:
+            self.last_report = time.time()
+            sys.stdout.write("\r" + self.line())
+            sys.stdout.flush()
+
+
+def bulk_index(store: EmbeddingStore, folder_path: str, workers: int, batch_size: int, resume: bool):
+    folder_path = os.path.abspath(os.path.expanduser(folder_path))
+    if not os.path.isdir(folder_path):
+        print(f"Not a directory: {folder_path}")
+        return
+
+    job = _resumable_job(store, folder_path) if resume else None
+    if job is None:
+        job_id = store.create_job(folder_path, source="cli")
+        previously_indexed = 0
+    else:
+        job_id = job["id"]
+        previously_indexed = job["indexed_count"]
+        store.update_job(job_id, state="running", error=None)
+        print(f"Resuming job {job_id} ({previously_indexed} indexed so far)")
+
+    # Only the filter stages run in this process; encoding is in the workers
+    pipeline = IndexingPipeline(store, preprocess=None, encode=None, batch_size=lambda: batch_size)
+    tree_cache = TreeCache(store, folder_path)
+    stats = {}
+    metadata = {}
+    files = pipeline.stream(folder_path, stats, tree_cache=tree_cache, metadata=metadata)
+    writer = EmbeddingWriter(store, verbose=False, metadata=metadata)
+    report = ThroughputReport(stats, writer)
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f"Indexing {folder_path} with {workers} worker processes, {batch_size} images per chunk")
+    start_time = time.time()
+
+    # Files that failed to encode; retried next run, so their directories
+    # must not be cached as done
+    unwritten = []
+
+    def collect(done):
+        for future in done:
+            paths, embeddings, failures = future.result()
+            writer.submit(paths, embeddings)
+            for file_path, stage, error_class, message in failures:
+                metadata.pop(file_path, None)
+                if stage == "decode":
+                    store.quarantine_file(file_path, message, stage=stage, error_class=error_class)
+                else:
+                    unwritten.append(file_path)
+
+    def checkpoint(state: str):
+        elapsed = time.time() - start_time
+        indexed = stats.get("reused", 0) + writer.indexed_count
+        store.update_job(
+            job_id,
+            state=state,
+            cursor=writer.last_written,
+            total_count=stats.get("scanned", 0),
+            processed_count=writer.processed_count,
+            indexed_count=previously_indexed + indexed,
+            images_per_second=indexed / elapsed if elapsed > 0 else 0,
+        )
+
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(torch_threads, str(store.db_path.parent / "thumbnails"))) as pool:
+            pending = set()
+            for number, chunk in enumerate(_chunks(files, batch_size), 1):
+                # Hashes from the scan double as thumbnail ids in the worker
+                file_hashes = [metadata.get(path, (None, None))[1] for path in chunk]
+                pending.add(pool.submit(_encode_chunk, chunk, file_hashes))
+                if len(pending) >= workers * CHUNKS_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if number % CHECKPOINT_EVERY_CHUNKS == 0:
+                    checkpoint("running")
+                report.maybe_print()
+
+            while pending:
+                done, pending = wait(pending, timeout=REPORT_INTERVAL, return_when=FIRST_COMPLETED)
+                collect(done)
+                report.maybe_print()
+    except KeyboardInterrupt:
+        writer.close()
+        checkpoint("interrupted")
+        print(f"\nInterrupted. Run again with --resume to continue job {job_id}.")
+        raise
+    except Exception as e:
+        writer.close()
+        checkpoint("failed")
+        store.update_job(job_id, error=str(e))
+        raise
+
+    writer.close()
+    tree_cache.commit(unwritten + writer.failed)
+    checkpoint("completed")
+    store.update_job(job_id, skipped_count=stats["skipped"], rejected_count=sum(stats["rejected"].values()))
+    print("\r" + report.line())
+    print(f"Finished {folder_path} in {time.time() - start_time:.1f}s "
+          f"(skipped {stats['skipped']}, rejected {sum(stats['rejected'].values())}, "
+          f"removed {stats['deleted']} deleted files)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index image folders into the embeddings database.")
+    parser.add_argument("folders", nargs="+", help="Folders to index")
+    parser.add_argument("--db", default="embeddings/embeddings.db", help="Database path (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: all cores, limited by free memory)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE * 2,
+                        help="Images per chunk sent to a worker (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the last interrupted job for each folder instead of starting a new one")
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore(args.db, model_id=MODEL_ID)
+    workers = args.workers or default_workers()
+    try:
+        for folder in args.folders:
+            bulk_index(store, folder, workers, args.batch_size, args.resume)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,20 @@
 
 import os
 import asyncio
+import threading
 import state as state
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.routing import Mount
 
-from routes import folders, search, open_file, websocket, database
-from services.embeddings import extract_and_store_embeddings, embedding_store, index_folder_async
-from services.watcher import start_watcher
+from routes import folders, search, open_file, websocket, database, jobs, thumbnails
+from services.cleanup import cleanup_manager
+from services.embeddings import extract_and_store_embeddings, embedding_store, migration_runner
+from services.jobs import job_manager
+from services.throttle import indexing_throttle
+from services.worker import maintenance_executor
+from services.watcher import start_watcher, add_watcher
 from state import watched_folders, current_image_dir
 
 app = FastAPI()
@@ -66,14 +71,34 @@ app.include_router(open_file.router, tags=["File Operations"])
 app.include_router(folders.router,  tags=["Folder Management"])
 app.include_router(websocket.router, tags=["WebSocket"])
 app.include_router(database.router, tags=["Database"])
+app.include_router(jobs.router,     tags=["Indexing Jobs"])
+app.include_router(thumbnails.router, tags=["Thumbnails"])
 
 # ─── Startup / Shutdown ──────────────────────────────────────────────────
 observer = None  # file-system watcher handle
 
+# Set at shutdown; background migrations stop after their current batch and
+# resume from the saved cursor on the next start
+migrations_stop = threading.Event()
+
+
+def run_migrations() -> None:
+    try:
+        migration_runner.run(pace=lambda: indexing_throttle.pace(migrations_stop), stop=migrations_stop)
+    except Exception as e:
+        print(f"Database migration failed, will resume on next start: {e}")
+
 
 @app.on_event("startup")
 async def startup_event():
     global observer
+
+    # Rewrite existing rows for pending schema migrations in the background;
+    # the store reads both old and new layouts meanwhile
+    pending = migration_runner.pending()
+    if pending:
+        print(f"Running {len(pending)} database migration(s) in the background...")
+        asyncio.get_running_loop().run_in_executor(maintenance_executor, run_migrations)
     
     # Only index default folder if no embeddings exist yet
     stats = embedding_store.get_stats()
@@ -89,12 +114,27 @@ async def startup_event():
     print("Starting watcher for default folder...")
     observer = start_watcher(BASE_IMAGE_DIR, embedding_store)
 
+    # Jobs still queued, running or paused were cut off by the last shutdown;
+    # pick them up from their last checkpoint
+    for job in embedding_store.get_interrupted_jobs():
+        folder = job["folder_path"]
+        if not os.path.isdir(folder):
+            embedding_store.update_job(job["id"], state="failed", error="Folder no longer exists")
+            continue
+        print(f"Resuming interrupted indexing job {job['id']} for {folder}")
+        if folder not in watched_folders:
+            add_watcher(folder, embedding_store)
+            watched_folders.append(folder)
+        job_manager.submit(folder, job_id=job["id"], paused=job["state"] == "paused")
+
     remount_static_files()
     print("Startup complete.")
 
 
 @app.on_event("shutdown")
 def shutdown_event():
+    migrations_stop.set()
+    cleanup_manager.stop_all()
     if observer:
         observer.stop()
         observer.join()
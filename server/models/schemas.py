@@ -1,15 +1,18 @@
 # server/models/schemas.py
+from typing import Optional
 from pydantic import BaseModel
 
 
 class Query(BaseModel):
     query: str
+    folder: Optional[str] = None  # only search images under this folder
 
 
 class SearchResult(BaseModel):
     path: str
     score: float
     full_url: str
+    thumbnail_url: Optional[str] = None
 
 
 class FilePathRequest(BaseModel):
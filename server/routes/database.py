@@ -1,25 +1,72 @@
-from fastapi import APIRouter
-from services.embeddings import embedding_store
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from services.cleanup import cleanup_manager
+from services.embeddings import embedding_store, migration_runner
 
 router = APIRouter()
 
+
+def _cleanup_or_404(cleanup_id: int):
+    job = cleanup_manager.get(cleanup_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Cleanup job not found: {cleanup_id}")
+    return job
+
 @router.get("/database/stats", tags=["Database"], summary="Get database statistics")
-async def get_database_stats():
+async def get_database_stats(folder: Optional[str] = None):
     stats = embedding_store.get_stats()
+    if folder:
+        stats["folder"] = folder
+        stats["folder_embeddings"] = embedding_store.count_embeddings(folder)
     return {
         "status": "success",
         **stats
     }
 
-@router.post("/database/cleanup", tags=["Database"], summary="Clean up missing files")
-async def cleanup_database():
-    removed_count = embedding_store.cleanup_missing_files()
+@router.get("/database/quarantine", tags=["Database"], summary="List files that failed to index")
+async def get_quarantined_files(limit: int = 1000):
+    files = embedding_store.list_quarantined(limit)
+    return {
+        "status": "success",
+        "count": len(files),
+        "files": files
+    }
+
+@router.get("/database/migrations", tags=["Database"], summary="Schema version and migration progress")
+async def get_migrations():
+    return {
+        "status": "success",
+        "schema_version": embedding_store.schema_version(),
+        "migrations": migration_runner.status()
+    }
+
+@router.post("/database/cleanup", tags=["Database"], summary="Start removing embeddings for missing files")
+async def cleanup_database(folder: Optional[str] = None):
+    job = cleanup_manager.start(folder)
+    return {
+        "status": "started",
+        **job.to_dict(),
+        "message": f"Checking {'files under ' + folder if folder else 'all files'} in the background"
+    }
+
+@router.get("/database/cleanup", tags=["Database"], summary="List cleanup jobs")
+async def list_cleanup_jobs():
     return {
         "status": "success",
-        "removed_embeddings": removed_count,
-        "message": f"Cleaned up {removed_count} embeddings for missing files"
+        "jobs": cleanup_manager.list()
     }
 
+@router.get("/database/cleanup/{cleanup_id}", tags=["Database"], summary="Get progress of one cleanup job")
+async def get_cleanup_job(cleanup_id: int):
+    return _cleanup_or_404(cleanup_id).to_dict()
+
+@router.post("/database/cleanup/{cleanup_id}/cancel", tags=["Database"], summary="Stop a running cleanup job")
+async def cancel_cleanup_job(cleanup_id: int):
+    _cleanup_or_404(cleanup_id)
+    job = cleanup_manager.cancel(cleanup_id)
+    return {"status": "success", **job.to_dict()}
+
 @router.post("/database/clear", tags=["Database"], summary="Clear all embeddings from database")
 async def clear_database():
     try:
@@ -1,13 +1,14 @@
 import os
 import asyncio
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List
 
-from services.embeddings import index_folder_async
+from services.jobs import job_manager
 from services.watcher import add_watcher
 from state import watched_folders, get_indexing_status
 from services.embeddings import embedding_store
+from services.throttle import indexing_throttle
 
 # Check common locations where the folder might be
 BASE_DIRECTORIES = [
@@ -34,18 +35,11 @@ router = APIRouter()
 
 
 @router.post("/folders", tags=["Folder Management"], summary="Add folders to index and watch")
-async def set_folders(request: Request, body: FoldersRequest, background_tasks: BackgroundTasks):
+async def set_folders(request: Request, body: FoldersRequest):
     global watched_folders
     
-    # Check if already indexing
-    status = get_indexing_status()
-    if status["is_indexing"]:
-        raise HTTPException(
-            status_code=409,
-            detail=f"Already indexing folder: {status['current_folder']}. Please wait for completion."
-        )
-    
     added_folders = []
+    jobs = []
 
     for folder in body.folders:
         full_path = None
@@ -70,8 +64,9 @@ async def set_folders(request: Request, body: FoldersRequest, background_tasks:
         try:
             print(f"Starting indexing for folder: {full_path}")
             
-            # Start async indexing in background
-            background_tasks.add_task(index_folder_async, full_path)
+            # Queue indexing; the job manager runs it when a slot is free
+            job = job_manager.submit(full_path)
+            jobs.append(job.to_dict())
 
             if full_path not in watched_folders:
                 add_watcher(full_path, embedding_store)
@@ -90,34 +85,38 @@ async def set_folders(request: Request, body: FoldersRequest, background_tasks:
         "status": "success",
         "added_folders": added_folders,
         "watched_folders": list(watched_folders),
-        "message": f"Indexing started for {len(added_folders)} folder(s). Check status or connect to WebSocket for progress updates."
+        "jobs": jobs,
+        "message": f"Indexing queued for {len(added_folders)} folder(s). Check /jobs or connect to WebSocket for progress updates."
     }
 
 
 @router.get("/indexing-status", tags=["Folder Management"], summary="Get current indexing status")
 async def get_indexing_status_endpoint():
-    return get_indexing_status()
+    status = get_indexing_status()
+    status["is_indexing"] = job_manager.has_active()
+    status["jobs"] = job_manager.list()
+    status["throttle"] = indexing_throttle.status()
+    return status
 
 
 @router.post("/reindex/", tags=["Folder Management"], summary="Clear database and reindex all watched folders")
-async def reindex_all_folders(request: Request, background_tasks: BackgroundTasks):
+async def reindex_all_folders(request: Request):
     global watched_folders
     
-    # Check if already indexing
-    status = get_indexing_status()
-    if status["is_indexing"]:
+    # Clearing the table under running jobs would leave it half-filled
+    if job_manager.has_active():
         raise HTTPException(
             status_code=409,
-            detail=f"Already indexing folder: {status['current_folder']}. Please wait for completion."
+            detail="Indexing jobs are still active. Cancel them or wait for completion."
         )
     
     print("REINDEX: Clearing all embeddings and rebuilding database from scratch")
     embedding_store.clear_embeddings()
     for folder in watched_folders:
-        background_tasks.add_task(index_folder_async, folder)
+        job_manager.submit(folder)
 
     return {
         "status": "success", 
-        "message": "Database cleared. Re-indexing started for all watched folders. All embeddings will be rebuilt from scratch.",
+        "message": "Database cleared. Re-indexing started for all watched folders. Previously seen images are restored from the embedding cache; only new content is re-embedded.",
         "warning": "All existing embeddings have been deleted"
     }
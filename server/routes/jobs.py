@@ -0,0 +1,49 @@
+# server/routes/jobs.py
+from fastapi import APIRouter, HTTPException
+
+from services.jobs import job_manager
+from services.embeddings import embedding_store
+
+router = APIRouter()
+
+
+def _job_or_404(job_id: int):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Indexing job not found: {job_id}")
+    return job
+
+
+@router.get("/jobs", tags=["Indexing Jobs"], summary="List indexing jobs")
+async def list_jobs():
+    return {
+        "status": "success",
+        "jobs": job_manager.list(),
+        "history": embedding_store.list_jobs(limit=50),
+    }
+
+
+@router.get("/jobs/{job_id}", tags=["Indexing Jobs"], summary="Get progress of one indexing job")
+async def get_job(job_id: int):
+    return _job_or_404(job_id).to_dict()
+
+
+@router.post("/jobs/{job_id}/pause", tags=["Indexing Jobs"], summary="Pause an indexing job")
+async def pause_job(job_id: int):
+    _job_or_404(job_id)
+    job = await job_manager.pause(job_id)
+    return {"status": "success", **job.to_dict()}
+
+
+@router.post("/jobs/{job_id}/resume", tags=["Indexing Jobs"], summary="Resume a paused indexing job")
+async def resume_job(job_id: int):
+    _job_or_404(job_id)
+    job = await job_manager.resume(job_id)
+    return {"status": "success", **job.to_dict()}
+
+
+@router.post("/jobs/{job_id}/cancel", tags=["Indexing Jobs"], summary="Cancel an indexing job")
+async def cancel_job(job_id: int):
+    _job_or_404(job_id)
+    job = await job_manager.cancel(job_id)
+    return {"status": "success", **job.to_dict()}
@@ -1,17 +1,23 @@
 # server/routes/search.py
+import time
 from fastapi import APIRouter, HTTPException, Request
 from typing import List
 
 from models.schemas import Query, SearchResult
 from services.embeddings import search_images
+from services.throttle import search_latency
 
 router = APIRouter()
 
 
 @router.post("/search/", response_model=List[SearchResult])
 async def search_images_endpoint(query: Query, request: Request):
+    start_time = time.perf_counter()
     try:
-        results = search_images(query.query, request)
+        results = search_images(query.query, request, folder=query.folder)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Feeds the indexing throttle
+        search_latency.record(time.perf_counter() - start_time)
@@ -0,0 +1,38 @@
+import asyncio
+import os
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from services.embeddings import embedding_store, thumbnail_cache
+
+router = APIRouter()
+
+# Thumbnails are content-addressed, so a given URL never changes
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _create_thumbnail(thumbnail_id: str):
+    """Build a missing thumbnail from any indexed file with this content."""
+    for file_path in embedding_store.find_files_by_hash(thumbnail_id):
+        if not os.path.exists(file_path):
+            continue
+        try:
+            if thumbnail_cache.create(file_path) == thumbnail_id:
+                return thumbnail_cache.path_for(thumbnail_id)
+        except Exception as e:
+            print(f"Error creating thumbnail for {file_path}: {e}")
+    return None
+
+
+@router.get("/thumbnails/{thumbnail_id}", tags=["Thumbnails"], summary="Get a result thumbnail")
+async def get_thumbnail(thumbnail_id: str):
+    path = thumbnail_cache.path_for(thumbnail_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    if not path.exists():
+        # Rows reused from the embedding cache or indexed before thumbnails
+        # existed have none yet
+        path = await asyncio.to_thread(_create_thumbnail, thumbnail_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return FileResponse(path, media_type=thumbnail_cache.media_type, headers={"Cache-Control": CACHE_CONTROL})
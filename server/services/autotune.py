@@ -0,0 +1,215 @@
+import json
+import os
+import platform
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import psutil
+import torch
+
+DEFAULT_BATCH_SIZE = 16
+CANDIDATE_BATCH_SIZES = (4, 8, 16, 32, 64)
+CACHE_PATH = Path("embeddings/batch_size_cache.json")
+
+# Fraction of currently available memory the encoder batch may occupy
+MEMORY_BUDGET_FRACTION = 0.5
+
+# Bumped when the measurement changes; older cached calibrations are redone.
+# 2: memory measured from before the warm-up pass (1 read ~0 on CPU)
+CALIBRATION_VERSION = 2
+
+_cached: dict = {}
+_lock = threading.Lock()
+
+
+def _machine_key(model_id: str, device: str) -> str:
+    """Identify the machine/backend/model combination a calibration is valid for."""
+    return "|".join([
+        platform.node(),
+        platform.machine(),
+        str(os.cpu_count()),
+        str(psutil.virtual_memory().total),
+        device,
+        torch.__version__,
+        str(torch.get_num_threads()),
+        model_id,
+    ])
+
+
+def _load_cache() -> dict:
+    try:
+        with open(CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: dict) -> None:
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = CACHE_PATH.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        print(f"[AUTOTUNE] Could not save batch size cache: {e}")
+
+
+class _PeakMemorySampler:
+    """Poll process RSS in the background and remember the highest value seen."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def _measure(model, device: str, batch_size: int, image_size: int, rounds: int,
+             baseline_rss: Optional[int] = None) -> dict:
+    """
+    Time ``rounds`` passes at batch_size and record the memory they need on
+    top of baseline_rss (the process before any calibration pass; on CPU
+    the allocator keeps freed activations, so RSS taken later would already
+    include them). Memory is sampled from before the input is allocated
+    through the warm-up pass, which is where most of it gets allocated.
+    """
+    if device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        baseline_cuda = torch.cuda.memory_allocated()
+
+    with _PeakMemorySampler() as sampler:
+        if baseline_rss is None:
+            baseline_rss = sampler.peak
+        batch = torch.randn(batch_size, 3, image_size, image_size, device=device)
+        with torch.no_grad():
+            # Warm-up pass so lazy allocations and kernel selection are not timed
+            model.encode_image(batch)
+            if device == "cuda":
+                torch.cuda.synchronize()
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                model.encode_image(batch)
+            if device == "cuda":
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+        del batch
+
+    if device == "cuda":
+        # The model's weights are already in baseline_cuda
+        peak_bytes = torch.cuda.max_memory_allocated() - baseline_cuda
+    else:
+        peak_bytes = max(sampler.peak - baseline_rss, 0)
+
+    return {
+        "batch_size": batch_size,
+        "images_per_second": (batch_size * rounds) / elapsed if elapsed > 0 else 0.0,
+        "peak_bytes": peak_bytes,
+        "peak_rss_mb": sampler.peak / (1024 * 1024),
+    }
+
+
+def calibrate_batch_size(model, device: str, model_id: str,
+                         candidates=CANDIDATE_BATCH_SIZES,
+                         image_size: int = 224, rounds: int = 2) -> dict:
+    """
+    Time the image encoder on synthetic tensors for each candidate batch size
+    and cache the fastest one for this machine/model.
+
+    Returns the calibration record that was stored.
+    """
+    print(f"[AUTOTUNE] Calibrating batch size on {device} for {model_id}...")
+    ceiling = memory_ceiling()
+    measurements = []
+    # Before any pass, so every size is measured against the bare model
+    baseline_rss = psutil.Process().memory_info().rss
+
+    for batch_size in candidates:
+        if batch_size > ceiling:
+            break
+        try:
+            result = _measure(model, device, batch_size, image_size, rounds, baseline_rss)
+        except RuntimeError as e:
+            # Out of memory (CUDA or CPU allocator) - larger sizes will not fit either
+            print(f"[AUTOTUNE] Batch size {batch_size} failed: {e}")
+            break
+        measurements.append(result)
+        print(f"[AUTOTUNE] batch={batch_size}: {result['images_per_second']:.1f} img/s, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    if measurements:
+        best = max(measurements, key=lambda m: m["images_per_second"])
+        # Prefer the smallest size within 5% of the best throughput: less memory, same speed
+        best = min(
+            (m for m in measurements if m["images_per_second"] >= best["images_per_second"] * 0.95),
+            key=lambda m: m["batch_size"],
+        )
+        per_image_bytes = max(m["peak_bytes"] / m["batch_size"] for m in measurements)
+    else:
+        best = {"batch_size": DEFAULT_BATCH_SIZE}
+        per_image_bytes = 0
+
+    record = {
+        "batch_size": best["batch_size"],
+        "per_image_bytes": per_image_bytes,
+        "measurements": measurements,
+        "calibrated_at": time.time(),
+        "version": CALIBRATION_VERSION,
+    }
+
+    cache = _load_cache()
+    cache[_machine_key(model_id, device)] = record
+    _save_cache(cache)
+    print(f"[AUTOTUNE] Selected batch size {record['batch_size']}")
+    return record
+
+
+def memory_ceiling(per_image_bytes: float = 0) -> int:
+    """Largest batch size that fits in the memory budget, given the cost of one image."""
+    if per_image_bytes <= 0:
+        return max(CANDIDATE_BATCH_SIZES)
+    available = psutil.virtual_memory().available * MEMORY_BUDGET_FRACTION
+    return max(1, int(available // per_image_bytes))
+
+
+def get_batch_size(model, device: str, model_id: str, recalibrate: bool = False) -> int:
+    """
+    Return the encoding batch size for this machine/model, calibrating once
+    and reusing the cached result afterwards. The result is capped by what
+    currently fits in available memory.
+    """
+    key = _machine_key(model_id, device)
+    with _lock:
+        record: Optional[dict] = None if recalibrate else _cached.get(key)
+        if record is None and not recalibrate:
+            record = _load_cache().get(key)
+        if record is not None and record.get("version") != CALIBRATION_VERSION:
+            record = None
+        if record is None:
+            try:
+                record = calibrate_batch_size(model, device, model_id)
+            except Exception as e:
+                print(f"[AUTOTUNE] Calibration failed, using default batch size: {e}")
+                record = {"batch_size": DEFAULT_BATCH_SIZE, "per_image_bytes": 0, "version": CALIBRATION_VERSION}
+        _cached[key] = record
+
+    return max(1, min(record["batch_size"], memory_ceiling(record.get("per_image_bytes", 0))))
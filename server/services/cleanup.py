@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .embeddings import embedding_store, manager
+from .worker import ProgressChannel, maintenance_executor
+
+# Finished cleanup jobs kept for the status endpoint
+MAX_FINISHED_JOBS = 20
+
+
+class CleanupJob:
+    """In-memory handle for one run of cleanup_missing_files."""
+
+    def __init__(self, job_id: int, folder_path: Optional[str]):
+        self.id = job_id
+        self.folder_path = folder_path
+        self.state = "running"
+        self.checked_count = 0
+        self.removed_count = 0
+        self.total_count = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stop = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def update_progress(self, checked: int, removed: int, total: int):
+        self.checked_count = checked
+        self.removed_count = removed
+        self.total_count = total
+
+    def to_dict(self) -> dict:
+        total = self.total_count
+        return {
+            "cleanup_id": self.id,
+            "folder": self.folder_path,
+            "state": self.state,
+            "checked_count": self.checked_count,
+            "removed_count": self.removed_count,
+            "total_count": total,
+            "percentage": round(self.checked_count / total * 100, 2) if total > 0 else 0.0,
+            "error": self.error,
+            "elapsed_time": (self.finished_at or time.time()) - self.started_at,
+        }
+
+
+class CleanupManager:
+    """
+    Runs cleanup jobs on the maintenance executor, one at a time, and
+    broadcasts their progress over the WebSocket like indexing jobs do.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[int, CleanupJob] = {}
+        self._next_id = 1
+
+    def active(self) -> Optional[CleanupJob]:
+        return next((job for job in self.jobs.values() if job.state == "running"), None)
+
+    def start(self, folder_path: Optional[str] = None) -> CleanupJob:
+        """Start a cleanup, or return the one already running. Call from the event loop."""
+        job = self.active()
+        if job is not None:
+            return job
+        job = CleanupJob(self._next_id, folder_path)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self._prune()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def _run(self, job: CleanupJob):
+        loop = asyncio.get_running_loop()
+        channel = ProgressChannel(loop)
+
+        def run() -> int:
+            try:
+                return embedding_store.cleanup_missing_files(
+                    job.folder_path,
+                    on_progress=lambda checked, removed, total: channel.emit((checked, removed, total)),
+                    stop=job.stop,
+                )
+            finally:
+                channel.close()
+
+        print(f"Cleaning up missing files under {job.folder_path or 'all folders'}")
+        future = loop.run_in_executor(maintenance_executor, run)
+        try:
+            while (message := await channel.get()) is not None:
+                job.update_progress(*message)
+                await manager.broadcast({"type": "cleanup_progress", **job.to_dict()})
+            job.removed_count = await future
+            job.state = "cancelled" if job.stop.is_set() else "completed"
+            print(f"Cleanup {job.id} {job.state}: removed {job.removed_count} of {job.checked_count} checked")
+        except asyncio.CancelledError:
+            # The thread would otherwise walk the rest of the table and hold up exit
+            job.stop.set()
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            print(f"Cleanup {job.id} failed: {e}")
+        job.finished_at = time.time()
+        await manager.broadcast({"type": "cleanup_complete", **job.to_dict()})
+
+    def cancel(self, job_id: int) -> Optional[CleanupJob]:
+        job = self.jobs.get(job_id)
+        if job is not None and job.state == "running":
+            job.stop.set()
+        return job
+
+    def stop_all(self):
+        """Ask every running cleanup to stop after its current batch; for shutdown."""
+        for job in self.jobs.values():
+            if job.state == "running":
+                job.stop.set()
+
+    def get(self, job_id: int) -> Optional[CleanupJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[dict]:
+        return [job.to_dict() for job in self.jobs.values()]
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.state != "running"]
+        for job_id in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job_id]
+
+
+cleanup_manager = CleanupManager()
@@ -0,0 +1,18 @@
+import open_clip
+import torch
+
+MODEL_NAME = 'ViT-B-32'
+MODEL_PRETRAINED = 'laion2b_s34b_b79k'
+MODEL_ID = f"{MODEL_NAME}/{MODEL_PRETRAINED}"
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def load_model(device: str):
+    """Create the CLIP model on device; returns (model, preprocess, tokenizer)."""
+    model, _, preprocess = open_clip.create_model_and_transforms(MODEL_NAME, pretrained=MODEL_PRETRAINED)
+    model = model.to(device)
+    model.eval()
+    return model, preprocess, open_clip.get_tokenizer(MODEL_NAME)
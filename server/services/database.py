@@ -1,21 +1,150 @@
 import sqlite3
 import pickle
+import json
 import hashlib
 import os
-from typing import Optional, Iterator, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Iterable, Iterator, Tuple, List, Dict, Set
 from datetime import datetime
 import numpy as np
 from pathlib import Path
 
+from .migrations import MIGRATIONS
+
+# Read buffer for content hashing; large reads keep throughput up on spinning
+# disks and network mounts
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_WORKERS = 8
+
+# indexing_jobs columns that update_job may set
+_JOB_FIELDS = {
+    "state", "cursor", "total_count", "processed_count", "indexed_count",
+    "skipped_count", "rejected_count", "images_per_second", "error",
+}
+
+# schema_version columns that update_migration may set
+_MIGRATION_FIELDS = {"state", "cursor", "processed_count", "total_count"}
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+_SQL_BATCH_SIZE = 500
+
+# Embeddings are stored as raw little-endian float32 bytes. Databases from
+# before this stored pickled arrays, converted by a background migration.
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+# cleanup_missing_files checks and deletes this many paths per transaction,
+# with this many threads checking existence
+CLEANUP_BATCH_SIZE = 1000
+CLEANUP_WORKERS = 16
+
+# Per-connection SQLite tuning. WAL lets searches read while the indexer or
+# watcher writes; synchronous=NORMAL only fsyncs at checkpoints under WAL.
+SQLITE_CACHE_KIB = 64 * 1024
+SQLITE_MMAP_BYTES = 256 * 1024 * 1024
+SQLITE_BUSY_TIMEOUT = 30.0  # seconds
+SQLITE_STATEMENT_CACHE = 256
+
+# Columns added after the original schema: (name, type)
+_STAT_COLUMNS = [
+    ("file_size", "INTEGER"),
+    ("mtime_ns", "INTEGER"),
+    ("inode", "INTEGER"),
+]
+
+
+def stat_signature(file_path: str, st: os.stat_result = None) -> Optional[Tuple[int, int, int]]:
+    """(size, mtime_ns, inode) of a file, or None if it cannot be stat'ed."""
+    try:
+        st = st or os.stat(file_path)
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+    except OSError:
+        return None
+
+
+def content_hash(file_path: str) -> Optional[str]:
+    """MD5 of a file's content, or None if it cannot be read."""
+    try:
+        hash_md5 = hashlib.md5()
+        with open(file_path, "rb", buffering=0) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+    except OSError:
+        return None
+
+
+def folder_range(folder_path: str) -> Tuple[str, str]:
+    """Bounds (inclusive, exclusive) of the file_path keys under folder_path."""
+    prefix = os.path.join(folder_path, "")
+    # Smallest string greater than every string starting with prefix
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _compare_signatures(scanned: Dict[str, Optional[Tuple[int, int, int]]],
+                        manifest: Dict[str, tuple]) -> Tuple[Set[str], Set[str], list]:
+    """Split scanned files into new, changed, and (path, stored hash, signature) to hash."""
+    new = set()
+    changed = set()
+    to_hash = []
+    for file_path, signature in scanned.items():
+        stored = manifest.get(file_path)
+        if stored is None:
+            new.add(file_path)
+        elif signature is None:
+            changed.add(file_path)
+        elif tuple(stored[:3]) != signature:
+            to_hash.append((file_path, stored[3], signature))
+    return new, changed, to_hash
+
 
 class EmbeddingStore:
-    def __init__(self, db_path: str = "embeddings/embeddings.db"):
+    def __init__(self, db_path: str = "embeddings/embeddings.db", model_id: str = "default"):
         self.db_path = Path(db_path)
+        self.model_id = model_id
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.embedding_dim: Optional[int] = None
+        self._legacy_blobs = False
+        self._folder_index_ready = False
+        self._folder_ids: Dict[str, int] = {}
         self._init_database()
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """A new connection with the store's pragmas applied."""
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        The calling thread's connection, opened on first use and kept for
+        the life of the thread so its page cache and prepared statements
+        are reused. Use it as a context manager to commit or roll back.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open_connection()
+        return conn
+
+    def _fetch_dicts(self, sql: str, params: tuple = ()) -> List[dict]:
+        cursor = self._connection().execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
     
     def _init_database(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS embeddings (
                     file_path TEXT PRIMARY KEY,
@@ -36,20 +165,338 @@ class EmbeddingStore:
                 CREATE INDEX IF NOT EXISTS idx_last_modified 
                 ON embeddings(last_modified)
             """)
+
+            # Databases created before stat signatures were stored lack these
+            # columns; rows with NULLs fall back to a hash check once.
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+            for column, column_type in _STAT_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE embeddings ADD COLUMN {column} {column_type}")
+
+            # Embeddings keyed by file content, independent of path. Rows here
+            # are kept when embeddings are cleared or files move.
+            cache_exists = conn.execute("""
+                SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embedding_cache'
+            """).fetchone() is not None
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    content_hash TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (content_hash, model_id)
+                )
+            """)
+            if not cache_exists:
+                # Seed from existing rows, which were produced by the current model
+                conn.execute("""
+                    INSERT OR IGNORE INTO embedding_cache (content_hash, model_id, embedding)
+                    SELECT file_hash, ?, embedding FROM embeddings
+                """, (self.model_id,))
+
+            # Folder indexing runs, checkpointed so they can resume after a restart
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indexing_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    folder_path TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    cursor TEXT,
+                    total_count INTEGER DEFAULT 0,
+                    processed_count INTEGER DEFAULT 0,
+                    indexed_count INTEGER DEFAULT 0,
+                    skipped_count INTEGER DEFAULT 0,
+                    images_per_second REAL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            job_columns = {row[1] for row in conn.execute("PRAGMA table_info(indexing_jobs)")}
+            if "rejected_count" not in job_columns:
+                conn.execute("ALTER TABLE indexing_jobs ADD COLUMN rejected_count INTEGER DEFAULT 0")
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_indexing_jobs_state
+                ON indexing_jobs(state)
+            """)
+
+            # Files that could not be decoded, skipped until their stat
+            # signature changes
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quarantine (
+                    file_path TEXT PRIMARY KEY,
+                    file_size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
+                    stage TEXT NOT NULL,
+                    error_class TEXT NOT NULL,
+                    error_message TEXT,
+                    attempts INTEGER DEFAULT 1,
+                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Storage format of the embedding blobs: embedding_format,
+            # embedding_dtype and embedding_dim
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS store_metadata (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            metadata = dict(conn.execute("SELECT key, value FROM store_metadata"))
+            if "embedding_format" not in metadata:
+                has_rows = conn.execute("""
+                    SELECT EXISTS (SELECT 1 FROM embeddings) OR EXISTS (SELECT 1 FROM embedding_cache)
+                """).fetchone()[0]
+                metadata["embedding_format"] = "pickle" if has_rows else "raw"
+                metadata["embedding_dtype"] = EMBEDDING_DTYPE.str
+                conn.executemany("INSERT OR REPLACE INTO store_metadata (key, value) VALUES (?, ?)", [
+                    ("embedding_format", metadata["embedding_format"]),
+                    ("embedding_dtype", metadata["embedding_dtype"]),
+                ])
+            self._legacy_blobs = metadata["embedding_format"] == "pickle"
+            self._folder_index_ready = metadata.get("folder_index") == "ready"
+            if "embedding_dim" in metadata:
+                self.embedding_dim = int(metadata["embedding_dim"])
+
+            # Everything above is the unversioned baseline. Later changes are
+            # numbered migrations: their schema part is applied here once,
+            # their data part runs in the background (see MigrationRunner).
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    cursor TEXT,
+                    processed_count INTEGER DEFAULT 0,
+                    total_count INTEGER DEFAULT 0,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP
+                )
+            """)
+            applied = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+                migration.apply(conn)
+                conn.execute("""
+                    INSERT INTO schema_version (version, name, state) VALUES (?, ?, ?)
+                """, (migration.version, migration.name, "pending" if migration.background else "completed"))
             
             conn.commit()
     
+    def _set_metadata(self, key: str, value) -> None:
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO store_metadata (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _reload_embedding_dim(self) -> Optional[int]:
+        """
+        Pick up embedding_dim when another process (bulk_index) wrote the
+        first rows after this store was opened on an empty database.
+        """
+        row = self._connection().execute(
+            "SELECT value FROM store_metadata WHERE key = 'embedding_dim'").fetchone()
+        if row is not None:
+            self.embedding_dim = int(row[0])
+        return self.embedding_dim
+
+    def _encode_embedding(self, embedding: np.ndarray) -> bytes:
+        vector = np.asarray(embedding, dtype=EMBEDDING_DTYPE).ravel()
+        if self.embedding_dim is None and self._reload_embedding_dim() is None:
+            self.embedding_dim = vector.size
+            self._set_metadata("embedding_dim", vector.size)
+        elif vector.size != self.embedding_dim:
+            raise ValueError(f"Embedding has {vector.size} dimensions, store holds {self.embedding_dim}")
+        return vector.tobytes()
+
+    def _is_raw(self, blob: bytes) -> bool:
+        return self.embedding_dim is not None and len(blob) == self.embedding_dim * EMBEDDING_DTYPE.itemsize
+
+    def _decode_embedding(self, blob: bytes) -> np.ndarray:
+        """(1, dim) array viewing the blob without a copy; read-only."""
+        if self.embedding_dim is None:
+            self._reload_embedding_dim()
+        if self._legacy_blobs and not self._is_raw(blob):
+            # Not yet migrated; a pickled (1, dim) array
+            return pickle.loads(blob)
+        if not self._is_raw(blob):
+            raise ValueError(f"Embedding blob of {len(blob)} bytes does not match dimension {self.embedding_dim}")
+        return np.frombuffer(blob, dtype=EMBEDDING_DTYPE).reshape(1, -1)
+
+    def has_legacy_blobs(self) -> bool:
+        """True until the raw_float32_embeddings migration has finished."""
+        return self._legacy_blobs
+
+    def count_rows(self, table: str) -> int:
+        with self._connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def convert_embedding_blobs(self, table: str, after_rowid: int, batch_size: int) -> Tuple[Optional[int], int]:
+        """
+        Rewrite pickled blobs in the next batch_size rows of table (embeddings
+        or embedding_cache) after after_rowid as raw float32, in one short
+        transaction. Rows already converted are recognised by their length.
+        Blobs that cannot be unpickled are deleted; the files are re-embedded
+        on the next scan. Returns (last rowid, or None past the end, rows read).
+        """
+        if self.embedding_dim is None:
+            with self._connection() as conn:
+                row = conn.execute(f"SELECT embedding FROM {table} LIMIT 1").fetchone()
+            if row is not None:
+                self._encode_embedding(pickle.loads(row[0]))
+
+        with self._connection() as conn:
+            rows = conn.execute(f"""
+                SELECT rowid, embedding FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?
+            """, (after_rowid, batch_size)).fetchall()
+            if not rows:
+                return None, 0
+            self._convert_rows(conn, table, rows)
+        return rows[-1][0], len(rows)
+
+    def _convert_rows(self, conn: sqlite3.Connection, table: str, rows: List[Tuple[int, bytes]]) -> None:
+        """Rewrite the pickled blobs among (rowid, blob) rows of table as raw float32."""
+        updates = []
+        broken = []
+        for rowid, blob in rows:
+            if self._is_raw(blob):
+                continue
+            try:
+                updates.append((self._encode_embedding(pickle.loads(blob)), rowid))
+            except Exception as e:
+                print(f"Dropping unreadable embedding in {table} (rowid {rowid}): {e}")
+                broken.append((rowid,))
+        conn.executemany(f"UPDATE {table} SET embedding = ? WHERE rowid = ?", updates)
+        conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", broken)
+
+    def mark_blobs_migrated(self) -> None:
+        self._set_metadata("embedding_format", "raw")
+        self._legacy_blobs = False
+
+    def schema_version(self) -> int:
+        """Highest migration whose schema part is applied."""
+        with self._connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+    def _intern_folders(self, conn: sqlite3.Connection, folder_paths: Iterable[str]) -> Dict[str, int]:
+        """
+        {folder path: folder id}, adding folders not seen before. New ids
+        only exist once conn commits, so callers pass the result to
+        _remember_folders after the transaction, never before.
+        """
+        ids = {}
+        for folder_path in set(folder_paths):
+            folder_id = self._folder_ids.get(folder_path)
+            if folder_id is None:
+                conn.execute("INSERT OR IGNORE INTO folders (path) VALUES (?)", (folder_path,))
+                folder_id = conn.execute("SELECT id FROM folders WHERE path = ?", (folder_path,)).fetchone()[0]
+            ids[folder_path] = folder_id
+        return ids
+
+    def _remember_folders(self, ids: Dict[str, int]) -> None:
+        """Cache folder ids from _intern_folders once their transaction has committed."""
+        self._folder_ids.update(ids)
+
+    def _locate(self, conn: sqlite3.Connection, file_paths: List[str]) -> Tuple[List[int], Dict[str, int]]:
+        """folder_id of each file path, and the folder ids to remember after commit."""
+        folders = [os.path.dirname(file_path) for file_path in file_paths]
+        ids = self._intern_folders(conn, folders)
+        return [ids[folder] for folder in folders], ids
+
+    def backfill_folder_ids(self, after_rowid: int, batch_size: int) -> Tuple[Optional[int], int]:
+        """
+        Fill folder_id for the next batch_size embeddings after after_rowid. Returns (last rowid, or None past the end, rows read).
+        """
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT rowid, file_path FROM embeddings WHERE rowid > ? ORDER BY rowid LIMIT ?
+            """, (after_rowid, batch_size)).fetchall()
+            if not rows:
+                return None, 0
+            locations, folder_ids = self._locate(conn, [file_path for _, file_path in rows])
+            conn.executemany("""
+                UPDATE embeddings SET folder_id = ? WHERE rowid = ? AND folder_id IS NULL
+            """, [(folder_id, rowid) for folder_id, (rowid, _) in zip(locations, rows)])
+        self._remember_folders(folder_ids)
+        return rows[-1][0], len(rows)
+
+    def has_embedding_names(self) -> bool:
+        """Whether embeddings still has the name column of older databases."""
+        with self._connection() as conn:
+            return any(row[1] == "name" for row in conn.execute("PRAGMA table_info(embeddings)"))
+
+    def clear_embedding_names(self, after_rowid: int, batch_size: int) -> Tuple[Optional[int], int]:
+        """
+        Null the unused name column for the next batch_size embeddings after
+        after_rowid, freeing its space. Returns (last rowid, or None past the
+        end, rows read).
+        """
+        if not self.has_embedding_names():
+            return None, 0
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT rowid FROM embeddings WHERE rowid > ? ORDER BY rowid LIMIT ?
+            """, (after_rowid, batch_size)).fetchall()
+            if not rows:
+                return None, 0
+            conn.execute("""
+                UPDATE embeddings SET name = NULL WHERE rowid > ? AND rowid <= ? AND name IS NOT NULL
+            """, (after_rowid, rows[-1][0]))
+        return rows[-1][0], len(rows)
+
+    def mark_folder_index_ready(self) -> None:
+        self._set_metadata("folder_index", "ready")
+        self._folder_index_ready = True
+
+    def _folder_filter(self, folder_path: str) -> Tuple[str, tuple]:
+        """
+        SQL condition (and its parameters) matching embeddings under
+        folder_path. Uses the folder_id index once every row has a
+        folder_id, and the file_path key range until then.
+        """
+        folder_path = os.path.normpath(folder_path)
+        prefix, upper = folder_range(folder_path)
+        if self._folder_index_ready:
+            return ("folder_id IN (SELECT id FROM folders WHERE path = ? OR (path >= ? AND path < ?))",
+                    (folder_path, prefix, upper))
+        return "file_path >= ? AND file_path < ?", (prefix, upper)
+
+    def count_embeddings(self, folder_path: Optional[str] = None) -> int:
+        """Embeddings stored for files under folder_path, or in total."""
+        if folder_path is None:
+            return self.count_rows("embeddings")
+        condition, params = self._folder_filter(folder_path)
+        with self._connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM embeddings WHERE {condition}", params).fetchone()[0]
+
+    def get_migration(self, version: int) -> Optional[dict]:
+        rows = self._fetch_dicts("SELECT * FROM schema_version WHERE version = ?", (version,))
+        return rows[0] if rows else None
+
+    def list_migrations(self) -> List[dict]:
+        return self._fetch_dicts("SELECT * FROM schema_version ORDER BY version")
+
+    def update_migration(self, version: int, completed: bool = False, **fields) -> None:
+        """Record a migration's progress (state, cursor, processed_count, total_count)."""
+        unknown = set(fields) - _MIGRATION_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown migration fields: {', '.join(sorted(unknown))}")
+        assignments = [f"{name} = ?" for name in fields]
+        if completed:
+            assignments.append("completed_at = CURRENT_TIMESTAMP")
+        with self._connection() as conn:
+            conn.execute(f"""
+                UPDATE schema_version SET {", ".join(assignments)} WHERE version = ?
+            """, (*fields.values(), version))
+
     def _get_file_hash(self, file_path: str) -> str:
         """Calculate MD5 hash of file for change detection."""
-        try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except (OSError, IOError):
+        file_hash = content_hash(file_path)
+        if file_hash is None:
             # If we can't read the file, return a timestamp-based hash
             return hashlib.md5(str(datetime.now()).encode()).hexdigest()
+        return file_hash
     
     def _get_file_mtime(self, file_path: str) -> datetime:
         """Get file modification time."""
@@ -59,23 +506,60 @@ class EmbeddingStore:
             return datetime.now()
     
     def store_embedding(self, file_path: str, embedding: np.ndarray) -> bool:
+        return self.store_embeddings_bulk([(file_path, embedding, None, None)]) == 1
+
+    def store_embeddings_bulk(
+        self, rows: Iterable[Tuple[str, np.ndarray, Optional[Tuple[int, int, int]], Optional[str]]]
+    ) -> int:
+        """
+        Store many embeddings in one transaction.
+
+        Each row is (file_path, embedding, stat signature, file_hash). Pass
+        the signature and hash the scan already computed; either may be None,
+        in which case it is read from the file here (hashes in parallel).
+        Returns the number of rows written, 0 if the transaction failed.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        missing = [i for i, row in enumerate(rows) if row[3] is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(missing))) as pool:
+                hashes = list(pool.map(lambda i: self._get_file_hash(rows[i][0]), missing))
+            for i, file_hash in zip(missing, hashes):
+                rows[i] = (*rows[i][:3], file_hash)
+
+        records = []
+        cache_records = []
         try:
-            file_hash = self._get_file_hash(file_path)
-            last_modified = self._get_file_mtime(file_path)
-            embedding_blob = pickle.dumps(embedding)
-            
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO embeddings 
-                    (file_path, embedding, file_hash, last_modified)
-                    VALUES (?, ?, ?, ?)
-                """, (file_path, embedding_blob, file_hash, last_modified))
-                conn.commit()
-            
-            return True
+            for file_path, embedding, signature, file_hash in rows:
+                signature = signature or stat_signature(file_path)
+                if signature is None:
+                    signature = (None, None, None)
+                    last_modified = datetime.now()
+                else:
+                    last_modified = datetime.fromtimestamp(signature[1] / 1e9)
+                embedding_blob = self._encode_embedding(embedding)
+                records.append((file_path, embedding_blob, file_hash, last_modified, *signature))
+                cache_records.append((file_hash, self.model_id, embedding_blob))
+
+            with self._connection() as conn:
+                locations, folder_ids = self._locate(conn, [record[0] for record in records])
+                conn.executemany("""
+                    INSERT OR REPLACE INTO embeddings
+                    (file_path, embedding, file_hash, last_modified, file_size, mtime_ns, inode, folder_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(*record, folder_id) for record, folder_id in zip(records, locations)])
+                conn.executemany("""
+                    INSERT OR REPLACE INTO embedding_cache (content_hash, model_id, embedding)
+                    VALUES (?, ?, ?)
+                """, cache_records)
+            self._remember_folders(folder_ids)
+            return len(records)
         except Exception as e:
-            print(f"Error storing embedding for {file_path}: {e}")
-            return False
+            print(f"Error storing {len(rows)} embeddings: {e}")
+            return 0
     
     def get_embedding(self, file_path: str) -> Optional[np.ndarray]:
         """
@@ -88,40 +572,42 @@ class EmbeddingStore:
             NumPy array containing the embedding, or None if not found
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.execute("""
                     SELECT embedding FROM embeddings WHERE file_path = ?
                 """, (file_path,))
                 
                 row = cursor.fetchone()
                 if row:
-                    return pickle.loads(row[0])
+                    return self._decode_embedding(row[0])
                 return None
         except Exception as e:
             print(f"Error retrieving embedding for {file_path}: {e}")
             return None
     
-    def get_all_embeddings(self) -> Iterator[Tuple[str, np.ndarray]]:
+    def get_all_embeddings(self, folder_path: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """(file_path, embedding) for every stored file, or only those under folder_path."""
+        condition, params = self._folder_filter(folder_path) if folder_path else ("1", ())
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT file_path, embedding FROM embeddings
-                """)
+            with self._connection() as conn:
+                cursor = conn.execute(f"""
+                    SELECT file_path, embedding FROM embeddings WHERE {condition}
+                """, params)
                 
                 for row in cursor:
                     file_path, embedding_blob = row
                     try:
-                        embedding = pickle.loads(embedding_blob)
+                        embedding = self._decode_embedding(embedding_blob)
                         yield file_path, embedding
                     except Exception as e:
-                        print(f"Error unpickling embedding for {file_path}: {e}")
+                        print(f"Error decoding embedding for {file_path}: {e}")
                         continue
         except Exception as e:
             print(f"Error retrieving all embeddings: {e}")
     
     def embedding_exists(self, file_path: str) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.execute("""
                     SELECT 1 FROM embeddings WHERE file_path = ? LIMIT 1
                 """, (file_path,))
@@ -131,37 +617,175 @@ class EmbeddingStore:
             return False
     
     def needs_reindexing(self, file_path: str) -> bool:
-        if not self.embedding_exists(file_path):
-            return True
-        
+        return bool(self.files_needing_reindex([file_path]))
+    
+    def files_needing_reindex(self, file_paths: List[str]) -> List[str]:
+        """
+        Return the subset of file_paths that must be (re-)embedded.
+
+        Files whose stored (size, mtime_ns, inode) signature matches the
+        current stat are skipped without reading them. Only files whose
+        signature changed are content-hashed, in parallel; if the hash still
+        matches, the stored signature is refreshed and the file is skipped.
+        """
+        to_index = []
+        to_hash = []
         try:
-            current_hash = self._get_file_hash(file_path)
-            current_mtime = self._get_file_mtime(file_path)
-            
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT file_hash, last_modified FROM embeddings 
+            with self._connection() as conn:
+                for file_path in file_paths:
+                    row = conn.execute("""
+                        SELECT file_hash, file_size, mtime_ns, inode FROM embeddings
+                        WHERE file_path = ?
+                    """, (file_path,)).fetchone()
+                    signature = stat_signature(file_path)
+
+                    if row is None or signature is None:
+                        to_index.append(file_path)
+                    elif tuple(row[1:]) != signature:
+                        to_hash.append((file_path, row[0], signature))
+        except Exception as e:
+            print(f"Error checking files for reindexing: {e}")
+            return list(file_paths)  # If in doubt, re-index
+
+        return to_index + self._confirm_changed(to_hash)
+    
+    def _confirm_changed(self, to_hash: List[Tuple[str, str, Tuple[int, int, int]]]) -> List[str]:
+        """
+        Hash files whose stat signature changed, in parallel, and return the
+        ones whose content really differs. The rest get their stored
+        signature refreshed.
+        """
+        if not to_hash:
+            return []
+
+        if len(to_hash) == 1:
+            hashes = [self._get_file_hash(to_hash[0][0])]
+        else:
+            with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+                hashes = list(pool.map(lambda item: self._get_file_hash(item[0]), to_hash))
+
+        changed = []
+        unchanged = []
+        for (file_path, stored_hash, signature), current_hash in zip(to_hash, hashes):
+            if current_hash == stored_hash:
+                unchanged.append((file_path, signature))
+            else:
+                changed.append(file_path)
+
+        if unchanged:
+            self._update_signatures(unchanged)
+        return changed
+    
+    def begin_scan(self, folder_path: str) -> "ScanSession":
+        """Start a chunked diff of a folder walk; see ScanSession."""
+        return ScanSession(self, folder_path)
+    
+    def _update_signatures(self, rows: List[Tuple[str, Tuple[int, int, int]]]) -> None:
+        """Record new stat signatures for files whose content did not change."""
+        try:
+            with self._connection() as conn:
+                conn.executemany("""
+                    UPDATE embeddings
+                    SET file_size = ?, mtime_ns = ?, inode = ?, last_modified = ?
                     WHERE file_path = ?
-                """, (file_path,))
-                
-                row = cursor.fetchone()
-                if not row:
-                    return True
-                
-                stored_hash, stored_mtime_str = row
-                stored_mtime = datetime.fromisoformat(stored_mtime_str.replace('Z', '+00:00')) if isinstance(stored_mtime_str, str) else stored_mtime_str
-                
-                # Check if file has been modified
-                return (current_hash != stored_hash or 
-                       current_mtime > stored_mtime)
-                
+                """, [
+                    (*signature, datetime.fromtimestamp(signature[1] / 1e9), file_path)
+                    for file_path, signature in rows
+                ])
+                conn.commit()
         except Exception as e:
-            print(f"Error checking if {file_path} needs reindexing: {e}")
-            return True  # If in doubt, re-index
+            print(f"Error updating file metadata: {e}")
     
+    def reuse_cached_embeddings(self, file_paths: List[str],
+                                signatures: Optional[Dict[str, Optional[Tuple[int, int, int]]]] = None,
+                                metadata: Optional[Dict[str, tuple]] = None) -> List[str]:
+        """
+        Fill in embeddings for files whose content was embedded before, under
+        any path, by the current model.
+
+        Hashes file_paths in parallel, copies cached embeddings for hits into
+        the embeddings table and returns the paths that still need inference.
+        Stat signatures from the scan are used when given. With a metadata
+        dict, {file_path: (signature, file_hash)} is recorded for each miss
+        so ``store_embeddings_bulk`` does not stat or hash it again.
+        """
+        if not file_paths:
+            return []
+
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            hashes = list(pool.map(self._get_file_hash, file_paths))
+
+        try:
+            with self._connection() as conn:
+                cached = set()
+                unique_hashes = list(set(hashes))
+                for i in range(0, len(unique_hashes), _SQL_BATCH_SIZE):
+                    chunk = unique_hashes[i:i + _SQL_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(f"""
+                        SELECT content_hash FROM embedding_cache
+                        WHERE model_id = ? AND content_hash IN ({placeholders})
+                    """, (self.model_id, *chunk))
+                    cached.update(row[0] for row in cursor)
+
+                hits = []
+                misses = []
+                for file_path, file_hash in zip(file_paths, hashes):
+                    signature = (signatures or {}).get(file_path) or stat_signature(file_path)
+                    if file_hash in cached and signature is not None:
+                        hits.append((file_path, datetime.fromtimestamp(signature[1] / 1e9),
+                                     *signature, file_hash, self.model_id))
+                    else:
+                        misses.append(file_path)
+                        if metadata is not None:
+                            metadata[file_path] = (signature, file_hash)
+
+                locations, folder_ids = self._locate(conn, [hit[0] for hit in hits])
+                conn.executemany("""
+                    INSERT OR REPLACE INTO embeddings
+                    (file_path, embedding, file_hash, last_modified, file_size, mtime_ns, inode, folder_id)
+                    SELECT ?, embedding, content_hash, ?, ?, ?, ?, ? FROM embedding_cache
+                    WHERE content_hash = ? AND model_id = ?
+                """, [(*hit[:5], folder_id, *hit[5:]) for hit, folder_id in zip(hits, locations)])
+                if self._legacy_blobs and hits:
+                    # A cache row not yet migrated would land behind the
+                    # migration's cursor and never be converted
+                    copied = [conn.execute("SELECT rowid, embedding FROM embeddings WHERE file_path = ?",
+                                           (hit[0],)).fetchone() for hit in hits]
+                    self._convert_rows(conn, "embeddings", [row for row in copied if row is not None])
+                conn.commit()
+                self._remember_folders(folder_ids)
+
+            if hits:
+                print(f"Reused {len(hits)} cached embeddings")
+            return misses
+        except Exception as e:
+            print(f"Error reusing cached embeddings: {e}")
+            return list(file_paths)
+    
+    def get_file_hashes(self, file_paths: List[str]) -> Dict[str, str]:
+        """{file_path: file_hash} for the given stored files."""
+        hashes = {}
+        with self._connection() as conn:
+            for i in range(0, len(file_paths), _SQL_BATCH_SIZE):
+                chunk = file_paths[i:i + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(f"""
+                    SELECT file_path, file_hash FROM embeddings WHERE file_path IN ({placeholders})
+                """, chunk)
+                hashes.update(cursor.fetchall())
+        return hashes
+
+    def find_files_by_hash(self, file_hash: str) -> List[str]:
+        with self._connection() as conn:
+            cursor = conn.execute("""
+                SELECT file_path FROM embeddings WHERE file_hash = ?
+            """, (file_hash,))
+            return [row[0] for row in cursor]
+
     def remove_embedding(self, file_path: str) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 conn.execute("""
                     DELETE FROM embeddings WHERE file_path = ?
                 """, (file_path,))
@@ -171,38 +795,174 @@ class EmbeddingStore:
             print(f"Error removing embedding for {file_path}: {e}")
             return False
     
+    def remove_embeddings(self, file_paths: List[str]) -> int:
+        """Delete embeddings for many files in one transaction."""
+        try:
+            with self._connection() as conn:
+                cursor = conn.executemany("""
+                    DELETE FROM embeddings WHERE file_path = ?
+                """, [(file_path,) for file_path in file_paths])
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Error removing embeddings: {e}")
+            return 0
+    
+    def quarantine_file(self, file_path: str, error, stage: str = "decode", error_class: str = None) -> None:
+        """
+        Record a file that failed to index so scans skip it until it changes.
+        error is the exception, or its message when error_class is given
+        (failures reported from another process).
+        """
+        error_class = error_class or type(error).__name__
+        signature = stat_signature(file_path) or (None, None, None)
+        try:
+            with self._connection() as conn:
+                conn.execute("""
+                    INSERT INTO quarantine
+                    (file_path, file_size, mtime_ns, inode, stage, error_class, error_message)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(file_path) DO UPDATE SET
+                        file_size = excluded.file_size,
+                        mtime_ns = excluded.mtime_ns,
+                        inode = excluded.inode,
+                        stage = excluded.stage,
+                        error_class = excluded.error_class,
+                        error_message = excluded.error_message,
+                        attempts = attempts + 1,
+                        last_seen = CURRENT_TIMESTAMP
+                """, (file_path, *signature, stage, error_class, str(error)))
+                conn.commit()
+        except Exception as e:
+            print(f"Error quarantining {file_path}: {e}")
+
+    def quarantined(self, signatures: Dict[str, Optional[Tuple[int, int, int]]]) -> Set[str]:
+        """
+        Return the paths in {file_path: signature} that are quarantined with
+        the same signature. Entries for files that changed since they failed
+        are dropped, so those files get another attempt.
+        """
+        skipped = set()
+        stale = []
+        paths = list(signatures)
+        try:
+            with self._connection() as conn:
+                for i in range(0, len(paths), _SQL_BATCH_SIZE):
+                    chunk = paths[i:i + _SQL_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(f"""
+                        SELECT file_path, file_size, mtime_ns, inode FROM quarantine
+                        WHERE file_path IN ({placeholders})
+                    """, chunk)
+                    for file_path, *stored in cursor:
+                        signature = signatures[file_path]
+                        if signature is not None and tuple(stored) == signature:
+                            skipped.add(file_path)
+                        else:
+                            stale.append((file_path,))
+                if stale:
+                    conn.executemany("DELETE FROM quarantine WHERE file_path = ?", stale)
+                    conn.commit()
+        except Exception as e:
+            print(f"Error checking quarantine: {e}")
+        return skipped
+
+    def list_quarantined(self, limit: int = 1000) -> List[dict]:
+        return self._fetch_dicts("""
+            SELECT file_path, stage, error_class, error_message, attempts, first_seen, last_seen
+            FROM quarantine ORDER BY last_seen DESC LIMIT ?
+        """, (limit,))
+
+    def load_directory_cache(self, folder_path: str) -> Dict[str, Tuple[int, float, List[str]]]:
+        """{dir_path: (mtime_ns, listed_at, subdir names)} for folder_path and below."""
+        prefix, upper = folder_range(folder_path)
+        try:
+            with self._connection() as conn:
+                cursor = conn.execute("""
+                    SELECT dir_path, mtime_ns, listed_at, subdirs FROM directory_cache
+                    WHERE dir_path = ? OR (dir_path >= ? AND dir_path < ?)
+                """, (folder_path, prefix, upper))
+                return {row[0]: (row[1], row[2], json.loads(row[3])) for row in cursor}
+        except Exception as e:
+            print(f"Error loading directory cache for {folder_path}: {e}")
+            return {}
+
+    def save_directory_cache(self, rows: List[Tuple[str, int, float, List[str]]]) -> None:
+        """Record (dir_path, mtime_ns, listed_at, subdir names) rows from a complete scan."""
+        try:
+            with self._connection() as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO directory_cache (dir_path, mtime_ns, listed_at, subdirs)
+                    VALUES (?, ?, ?, ?)
+                """, [(path, mtime_ns, listed_at, json.dumps(subdirs)) for path, mtime_ns, listed_at, subdirs in rows])
+                conn.commit()
+        except Exception as e:
+            print(f"Error saving directory cache: {e}")
+
     def clear_embeddings(self) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 conn.execute("DELETE FROM embeddings")
+                # Without rows the cached directories would be skipped forever
+                conn.execute("DELETE FROM directory_cache")
                 conn.commit()
             return True
         except Exception as e:
             print(f"Error clearing embeddings: {e}")
             return False
     
-    def cleanup_missing_files(self) -> int:
+    def cleanup_missing_files(self, folder_path: Optional[str] = None,
+                              on_progress: Optional[Callable[[int, int, int], None]] = None,
+                              stop: Optional[threading.Event] = None) -> int:
+        """
+        Remove embeddings for files that no longer exist, under folder_path
+        or everywhere, and return how many were removed.
+
+        Paths are paged through in CLEANUP_BATCH_SIZE batches on the
+        file_path key, checked on CLEANUP_WORKERS threads (each check is a
+        round trip on network mounts) and the missing ones deleted in one
+        short transaction per batch, so searches and indexing never wait on
+        the cleanup for long. on_progress(checked, removed, total) runs
+        after every batch; the cleanup ends early once stop is set.
+        """
+        if folder_path is not None:
+            folder_path = os.path.normpath(folder_path)
+            lower, upper = folder_range(folder_path)
+        else:
+            lower, upper = "", None
+        total = self.count_embeddings(folder_path)
+        checked = 0
         removed_count = 0
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("SELECT file_path FROM embeddings")
-                all_paths = [row[0] for row in cursor.fetchall()]
-                
-                for file_path in all_paths:
-                    if not os.path.exists(file_path):
-                        conn.execute("DELETE FROM embeddings WHERE file_path = ?", (file_path,))
-                        removed_count += 1
-                
-                conn.commit()
-                
-        except Exception as e:
-            print(f"Error during cleanup: {e}")
-        
+        last_path = None
+
+        with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as pool:
+            while stop is None or not stop.is_set():
+                conditions = ["file_path > ?" if last_path is not None else "file_path >= ?"]
+                params = [last_path if last_path is not None else lower]
+                if upper is not None:
+                    conditions.append("file_path < ?")
+                    params.append(upper)
+                with self._connection() as conn:
+                    paths = [row[0] for row in conn.execute(f"""
+                        SELECT file_path FROM embeddings WHERE {" AND ".join(conditions)}
+                        ORDER BY file_path LIMIT ?
+                    """, (*params, CLEANUP_BATCH_SIZE))]
+                if not paths:
+                    break
+
+                missing = [path for path, exists in zip(paths, pool.map(os.path.exists, paths)) if not exists]
+                if missing:
+                    removed_count += self.remove_embeddings(missing)
+                checked += len(paths)
+                last_path = paths[-1]
+                if on_progress is not None:
+                    on_progress(checked, removed_count, total)
+
         return removed_count
     
     def get_stats(self) -> dict:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.execute("SELECT COUNT(*) FROM embeddings")
                 total_embeddings = cursor.fetchone()[0]
                 
@@ -211,14 +971,190 @@ class EmbeddingStore:
                     WHERE created_at >= datetime('now', '-1 day')
                 """)
                 recent_embeddings = cursor.fetchone()[0]
+
+                cursor = conn.execute("""
+                    SELECT COUNT(*) FROM embedding_cache WHERE model_id = ?
+                """, (self.model_id,))
+                cached_embeddings = cursor.fetchone()[0]
+
+                cursor = conn.execute("SELECT COUNT(*) FROM quarantine")
+                quarantined_files = cursor.fetchone()[0]
                 
                 return {
                     "total_embeddings": total_embeddings,
                     "recent_embeddings": recent_embeddings,
+                    "cached_embeddings": cached_embeddings,
+                    "quarantined_files": quarantined_files,
+                    "embedding_format": "pickle" if self._legacy_blobs else "raw",
+                    "schema_version": self.schema_version(),
+                    "embedding_dim": self.embedding_dim,
                     "database_path": str(self.db_path),
                     "database_size_mb": self.db_path.stat().st_size / (1024 * 1024) if self.db_path.exists() else 0
                 }
         except Exception as e:
             print(f"Error getting database stats: {e}")
             return {"error": str(e)}
-    
\ No newline at end of file
+    
+    
+    def create_job(self, folder_path: str, state: str = "running", source: str = "server") -> int:
+        """Record a new indexing job and return its id. source is 'server' or 'cli' (bulk_index.py)."""
+        with self._connection() as conn:
+            cursor = conn.execute("""
+                INSERT INTO indexing_jobs (folder_path, state, source) VALUES (?, ?, ?)
+            """, (folder_path, state, source))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def update_job(self, job_id: int, **fields) -> None:
+        """Checkpoint job fields (state, cursor, counts, throughput, error)."""
+        unknown = set(fields) - _JOB_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        try:
+            with self._connection() as conn:
+                conn.execute(f"""
+                    UPDATE indexing_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (*fields.values(), job_id))
+                conn.commit()
+        except Exception as e:
+            print(f"Error updating indexing job {job_id}: {e}")
+    
+    def get_job(self, job_id: int) -> Optional[dict]:
+        rows = self._fetch_dicts("SELECT * FROM indexing_jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+    
+    def list_jobs(self, state: Optional[str] = None, limit: int = 100) -> List[dict]:
+        if state is None:
+            return self._fetch_dicts("""
+                SELECT * FROM indexing_jobs ORDER BY id DESC LIMIT ?
+            """, (limit,))
+        return self._fetch_dicts("""
+            SELECT * FROM indexing_jobs WHERE state = ? ORDER BY id DESC LIMIT ?
+        """, (state, limit))
+    
+    def get_interrupted_jobs(self) -> List[dict]:
+        """
+        Server jobs still queued, running or paused. Call at startup, before
+        any indexing starts: those jobs were cut off by a shutdown or crash.
+        Jobs of the bulk CLI, which may be running right now, are left alone.
+        Only the newest job per folder is returned; older duplicates are
+        superseded.
+        """
+        unfinished = self._fetch_dicts("""
+            SELECT * FROM indexing_jobs WHERE state IN ('queued', 'running', 'paused') AND source = 'server'
+            ORDER BY id
+        """)
+
+        jobs = {}
+        for job in unfinished:
+            if job["folder_path"] in jobs:
+                self.update_job(jobs[job["folder_path"]]["id"], state="superseded")
+            jobs[job["folder_path"]] = job
+        return list(jobs.values())
+
+
+class ScanSession:
+    """
+    Diff of one folder walk against the stored manifest, fed chunk by chunk
+    while the scan is still running so nothing has to hold the whole tree.
+
+    Every path passed to ``diff`` is recorded in a temporary table on this
+    session's own connection. ``finish`` then deletes the rows under the
+    folder that the walk never reached; call it only after a complete scan.
+    A session must be used from a single thread.
+    """
+
+    def __init__(self, store: EmbeddingStore, folder_path: str):
+        self.store = store
+        self.folder_path = os.path.normpath(folder_path)
+        self.conn = store._open_connection()
+        self.conn.execute("CREATE TEMP TABLE scan_seen (file_path TEXT PRIMARY KEY)")
+
+    def diff(self, scanned: Dict[str, Optional[Tuple[int, int, int]]]) -> Tuple[Set[str], Set[str]]:
+        """(new, changed) among a chunk of {file_path: signature} from the walk."""
+        paths = list(scanned)
+        manifest = {}
+        try:
+            self.conn.executemany("INSERT OR IGNORE INTO scan_seen (file_path) VALUES (?)",
+                                  [(file_path,) for file_path in paths])
+            for i in range(0, len(paths), _SQL_BATCH_SIZE):
+                chunk = paths[i:i + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self.conn.execute(f"""
+                    SELECT file_path, file_size, mtime_ns, inode, file_hash FROM embeddings
+                    WHERE file_path IN ({placeholders})
+                """, chunk)
+                manifest.update((row[0], row[1:]) for row in cursor)
+            # Don't hold a read snapshot between chunks; it would keep the
+            # WAL from being checkpointed for the whole scan
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error diffing scan of {self.folder_path}: {e}")
+            return set(scanned), set()  # If in doubt, re-index
+
+        new, changed, to_hash = _compare_signatures(scanned, manifest)
+        changed.update(self.store._confirm_changed(to_hash))
+        return new, changed
+
+    def finish(self, skipped_dirs: Iterable[str] = ()) -> int:
+        """
+        Remove embeddings for files under the folder that the scan did not
+        see, except those directly inside skipped_dirs, which the scan did
+        not list because they had not changed.
+
+        Once the folder index is ready only the rows of folders that were
+        not skipped are read, through the folder_id index, so a
+        rescan that skipped most of the tree does not touch its rows.
+        """
+        prefix, upper = folder_range(self.folder_path)
+        skipped = {os.path.normpath(path) for path in skipped_dirs}
+        try:
+            if not skipped:
+                cursor = self.conn.execute("""
+                    DELETE FROM embeddings
+                    WHERE file_path >= ? AND file_path < ?
+                    AND file_path NOT IN (SELECT file_path FROM scan_seen)
+                """, (prefix, upper))
+                self.conn.commit()
+                return cursor.rowcount
+
+            if self.store._folder_index_ready:
+                self.conn.execute("CREATE TEMP TABLE scan_skipped (dir_path TEXT PRIMARY KEY)")
+                self.conn.executemany("INSERT OR IGNORE INTO scan_skipped (dir_path) VALUES (?)",
+                                      [(path,) for path in skipped])
+                # Folders the scan listed, plus any that disappeared
+                cursor = self.conn.execute("""
+                    DELETE FROM embeddings
+                    WHERE folder_id IN (
+                        SELECT id FROM folders
+                        WHERE (path = ? OR (path >= ? AND path < ?))
+                        AND path NOT IN (SELECT dir_path FROM scan_skipped)
+                    )
+                    AND file_path NOT IN (SELECT file_path FROM scan_seen)
+                """, (self.folder_path, prefix, upper))
+                self.conn.commit()
+                return cursor.rowcount
+
+            # Rows without a folder_id yet: filter every unseen row by its directory
+            cursor = self.conn.execute("""
+                SELECT file_path FROM embeddings
+                WHERE file_path >= ? AND file_path < ?
+                AND file_path NOT IN (SELECT file_path FROM scan_seen)
+            """, (prefix, upper))
+            deleted = [(file_path,) for (file_path,) in cursor
+                       if os.path.normpath(os.path.dirname(file_path)) not in skipped]
+            self.conn.executemany("DELETE FROM embeddings WHERE file_path = ?", deleted)
+            self.conn.commit()
+            return len(deleted)
+        except Exception as e:
+            print(f"Error removing deleted files under {self.folder_path}: {e}")
+            return 0
+        finally:
+            self.close()
+
+    def close(self):
+        self.conn.close()
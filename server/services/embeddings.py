@@ -1,23 +1,34 @@
 import os
 import numpy as np
 import torch
-import open_clip
-from PIL import Image
 from fastapi import Request
 import state as state
 from urllib.parse import quote
 import asyncio
+import threading
 import time
-from typing import List
+from functools import partial
+from typing import List, Optional
+from .clip_model import MODEL_ID, default_device, load_model
 from .database import EmbeddingStore
+from .migrations import MigrationRunner
+from .autotune import get_batch_size
+from .pipeline import EmbeddingWriter, IndexingPipeline
+from .scanner import IMAGE_EXTENSIONS, TreeCache
+from .thumbnails import ThumbnailCache
+from .throttle import indexing_throttle
+from .worker import IndexingCancelled, ProgressChannel, run_on_indexing_thread
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, _, preprocess = open_clip.create_model_and_transforms('ViT-B-32', pretrained='laion2b_s34b_b79k')
-model = model.to(device)
-tokenizer = open_clip.get_tokenizer('ViT-B-32')
+device = default_device()
+model, preprocess, tokenizer = load_model(device)
 
 IMAGE_DIR = "data/"
-embedding_store = EmbeddingStore()
+embedding_store = EmbeddingStore(model_id=MODEL_ID)
+migration_runner = MigrationRunner(embedding_store)
+thumbnail_cache = ThumbnailCache()
+
+# Indexing jobs write a checkpoint to the database every this many batches
+CHECKPOINT_EVERY_BATCHES = 10
 
 # Connection manager for WebSocket notifications
 class ConnectionManager:
@@ -44,59 +55,20 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+def encode_images(batch_tensor: torch.Tensor) -> np.ndarray:
+    """Encode a stacked batch of preprocessed images with the CLIP image tower."""
+    with torch.no_grad():
+        return model.encode_image(batch_tensor.to(device)).cpu().numpy()
+
+pipeline = IndexingPipeline(
+    embedding_store, preprocess, encode_images,
+    batch_size=lambda: get_batch_size(model, device, MODEL_ID),
+    thumbnails=thumbnail_cache,
+    throttle=indexing_throttle,
+)
+
 async def process_image_batch(file_paths: list, store: EmbeddingStore) -> int:
-    if not file_paths:
-        return 0
-    
-    indexed_count = 0
-    batch_images = []
-    valid_paths = []
-    
-    for file_path in file_paths:
-        try:
-            image = Image.open(file_path)
-            processed_image = preprocess(image)
-            batch_images.append(processed_image)
-            valid_paths.append(file_path)
-        except Exception as e:
-            print(f"Error loading image {file_path}: {e}")
-            continue
-    
-    if not batch_images:
-        return 0
-    
-    try:
-        # Stack images into a batch tensor
-        batch_tensor = torch.stack(batch_images).to(device)
-        
-        # Process entire batch with CLIP model
-        with torch.no_grad():
-            batch_embeddings = model.encode_image(batch_tensor).cpu().numpy()
-        
-        # Store embeddings in database
-        for i, (file_path, embedding) in enumerate(zip(valid_paths, batch_embeddings)):
-            try:
-                embedding_reshaped = embedding.reshape(1, -1)
-                if store.store_embedding(file_path, embedding_reshaped):
-                    indexed_count += 1
-                    print(f"Indexed: {file_path}")
-            except Exception as e:
-                print(f"Error storing embedding for {file_path}: {e}")
-    
-    except Exception as e:
-        print(f"Error processing batch: {e}")
-        for file_path in valid_paths:
-            try:
-                image = preprocess(Image.open(file_path)).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    embedding = model.encode_image(image).cpu().numpy()
-                if store.store_embedding(file_path, embedding):
-                    indexed_count += 1
-                    print(f"Indexed (fallback): {file_path}")
-            except Exception as fallback_e:
-                print(f"Error in fallback processing {file_path}: {fallback_e}")
-    
-    return indexed_count
+    return await asyncio.to_thread(process_image_batch_sync, file_paths, store)
 
 def extract_and_store_embeddings():
     start_time = time.time()
@@ -104,43 +76,169 @@ def extract_and_store_embeddings():
     image_paths = [
         os.path.join(IMAGE_DIR, img)
         for img in os.listdir(IMAGE_DIR)
-        if img.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+        if img.lower().endswith(IMAGE_EXTENSIONS)
     ]
     
-    indexed_count = 0
-    skipped_count = 0
-    
-    for image_path in image_paths:
-        # Check if we need to reindex this file
-        if not embedding_store.needs_reindexing(image_path):
-            skipped_count += 1
-            continue
-            
-        try:
-            image = preprocess(Image.open(image_path)).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model.encode_image(image).cpu().numpy()
-            
-            if embedding_store.store_embedding(image_path, embedding):
-                indexed_count += 1
-                print(f"Indexed: {image_path}")
-            
-        except Exception as e:
-            print(f"Error embedding {image_path}: {e}")
+    files_to_process = pipeline.select(image_paths)
+    skipped_count = len(image_paths) - len(files_to_process)
+    files_to_process, rejected_count = pipeline.screen(files_to_process)
+    metadata = {}
+    files_to_process, indexed_count = pipeline.reuse_cached(files_to_process, metadata=metadata)
+    if files_to_process:
+        indexed_count += pipeline.run(files_to_process, metadata=metadata)["indexed_count"]
+
+    elapsed_time = time.time() - start_time
+    print(f"Embeddings extracted for default folder. Added: {indexed_count}, Skipped: {skipped_count} (already in database), Rejected: {rejected_count} - Time taken: {elapsed_time:.2f}s")
+
+def checkpoint_job(job_id: int, writer: EmbeddingWriter, indexed_before: int, start_time: float):
+    """Persist how far a job has got; only rows the writer has committed count."""
+    elapsed_time = time.time() - start_time
+    embedding_store.update_job(
+        job_id,
+        cursor=writer.last_written,
+        processed_count=writer.processed_count,
+        indexed_count=indexed_before + writer.indexed_count,
+        images_per_second=writer.indexed_count / elapsed_time if elapsed_time > 0 else 0,
+    )
+
+def run_indexing_job(folder_path: str, job: dict, emit=None, control=None, stop=None) -> dict:
+    """
+    Index a folder for ``job`` (a row from indexing_jobs) on the calling
+    thread: scan, diff, decode, encode and write all happen here, so callers
+    on the event loop run it with run_on_indexing_thread (services.worker).
+    The scan is streamed through the pipeline rather than collected first.
+
+    Progress messages go to ``emit``, which must be safe to call from this
+    thread. Between batches the job is paced by the adaptive throttle,
+    holds while ``control`` is paused and raises IndexingCancelled once
+    ``stop`` is set. Returns the final counts.
+    """
+    start_time = time.time()
+    job_id = job["id"]
+
+    def report(current_file: str, processed: int, total: int, percentage: float):
+        if emit is not None:
+            emit({
+                "type": "indexing_progress",
+                "folder": folder_path,
+                "job_id": job_id,
+                "current_file": current_file,
+                "processed": processed,
+                "total": total,
+                "percentage": percentage
+            })
+
+    def check_stop():
+        if control is not None:
+            control.block_while_paused(stop)
+        if stop is not None and stop.is_set():
+            raise IndexingCancelled(f"Indexing job {job_id} cancelled")
+
+    print(f"Indexing folder: {folder_path}")
+
+    # Counters carry over from the previous run of a resumed job
+    previously_indexed = job["indexed_count"]
+
+    # The walk streams straight into decoding: each chunk of scan results is
+    # diffed against the manifest, screened and looked up in the cache, and
+    # what is left is encoded while the scan carries on
+    stats = {}
+    # Signatures and hashes from the scan, so the writer does not redo them
+    metadata = {}
+    # Directories unchanged since the last completed run are not re-listed
+    tree_cache = TreeCache(embedding_store, folder_path)
+
+    def scan_progress(file_path: str, count: int):
+        report(os.path.basename(file_path), stats["queued"], count, 0)
+        if control is not None:
+            control.block_while_paused(stop)
+
+    files_to_process = pipeline.stream(
+        folder_path, stats, on_progress=scan_progress,
+        stopped=lambda: stop is not None and stop.is_set(), tree_cache=tree_cache,
+        metadata=metadata,
+    )
+    batch_size = pipeline.batch_size()
+    print(f"Streaming {folder_path} into batches of {batch_size}")
+
+    def after_batch(batch_number: int, decoder, writer):
+        if batch_number % CHECKPOINT_EVERY_BATCHES == 0:
+            checkpoint_job(job_id, writer, previously_indexed + stats["reused"], start_time)
+            embedding_store.update_job(job_id, total_count=stats["scanned"])
+
+        # Total grows until the walk finishes
+        total = stats["queued"]
+        report(
+            f"Batch {batch_number}", decoder.completed, total,
+            round((decoder.completed / total * 100), 2) if total > 0 else 0
+        )
+
+        # Back off while searches are slow or other programs need the CPU
+        indexing_throttle.pace(stop)
+        check_stop()
+
+    result = pipeline.run(
+        files_to_process, batch_size=batch_size,
+        decode_workers=getattr(control, "decode_workers", None), on_batch=after_batch,
+        metadata=metadata,
+    )
+    # A walk cut short by cancellation must not be recorded as complete
+    check_stop()
+    tree_cache.commit(result["unwritten"])
+
+    indexed_count = stats["reused"] + result["indexed_count"]
+    skipped_count = max(0, stats["skipped"] - previously_indexed)
+    rejected = stats["rejected"]
+    rejected_count = sum(rejected.values())
+    if rejected_count:
+        details = ", ".join(f"{reason}: {count}" for reason, count in rejected.most_common())
+        print(f"Rejected {rejected_count} files before decoding ({details})")
 
     elapsed_time = time.time() - start_time
-    print(f"Embeddings extracted for default folder. Added: {indexed_count}, Skipped: {skipped_count} (already in database) - Time taken: {elapsed_time:.2f}s")
-
-def count_images_in_folder(folder_path: str) -> int:
-    count = 0
-    for root, dirs, files in os.walk(folder_path):
-        for file_name in files:
-            if file_name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-                count += 1
-    return count
-
-async def index_folder_async(folder_path: str):
-    start_time = time.time()  
+    embedding_store.update_job(
+        job_id,
+        state="completed",
+        cursor=result["last_written"],
+        total_count=stats["scanned"],
+        processed_count=stats["scanned"],
+        indexed_count=previously_indexed + indexed_count,
+        skipped_count=skipped_count,
+        rejected_count=rejected_count,
+        images_per_second=indexed_count / elapsed_time if elapsed_time > 0 else 0,
+    )
+    indexed_count += previously_indexed
+    print(f"Indexing completed for {folder_path}. Added: {indexed_count}, Skipped: {skipped_count} (already in database), Rejected: {rejected_count} - Time taken: {elapsed_time:.2f}s")
+    return {"indexed_count": indexed_count, "skipped_count": skipped_count,
+            "rejected_count": rejected_count, "elapsed_time": elapsed_time}
+
+async def index_folder_async(folder_path: str, job_id: int = None, control=None):
+    """
+    Index a folder as a persistent job. Pass job_id to run a queued job or
+    resume one that was interrupted; files it already stored are skipped by
+    the manifest diff and its counters continue from the last checkpoint.
+
+    The work itself runs on a dedicated indexing thread (run_indexing_job);
+    this coroutine only relays its progress to WebSocket clients, so the
+    event loop stays free for searches while a folder is indexed.
+
+    control is the job manager's handle for this job (see services.jobs): it
+    receives progress updates and can hold the job between batches while
+    paused.
+    """
+    start_time = time.time()
+    job = embedding_store.get_job(job_id) if job_id is not None else None
+    if job is None:
+        job_id = embedding_store.create_job(folder_path)
+        job = embedding_store.get_job(job_id)
+    else:
+        embedding_store.update_job(job_id, state="running")
+        if job["cursor"] or job["indexed_count"]:
+            print(f"Resuming indexing job {job_id} for {folder_path} "
+                  f"({job['indexed_count']} indexed, last checkpoint at {job['cursor']})")
+
+    loop = asyncio.get_running_loop()
+    channel = ProgressChannel(loop)
+    stop = threading.Event()
     try:
         state.set_indexing_status(True, folder_path)
         state.reset_indexing_progress()
@@ -148,180 +246,87 @@ async def index_folder_async(folder_path: str):
         await manager.broadcast({
             "type": "indexing_started",
             "folder": folder_path,
+            "job_id": job_id,
             "timestamp": __import__('datetime').datetime.now().isoformat()
         })
-        
-        print(f"Indexing folder: {folder_path}")
-    
-        total_images = count_images_in_folder(folder_path)
-        processed_count = 0
-        indexed_count = 0
-        skipped_count = 0
-        files_to_process = [] 
-        
-        # First pass: collect all files that need processing
-        for root, dirs, files in os.walk(folder_path):
-            for file_name in files:
-                if file_name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-                    full_path = os.path.join(root, file_name)
-                    state.update_indexing_progress(full_path, processed_count, total_images)
-                    if processed_count % 10 == 0 or processed_count == total_images - 1:
-                        await manager.broadcast({
-                            "type": "indexing_progress",
-                            "folder": folder_path,
-                            "current_file": os.path.basename(full_path),
-                            "processed": processed_count,
-                            "total": total_images,
-                            "percentage": round((processed_count / total_images * 100), 2) if total_images > 0 else 0
-                        })
-                    if embedding_store.needs_reindexing(full_path):
-                        files_to_process.append(full_path)
-                    else:
-                        skipped_count += 1
-                    
-                    processed_count += 1
-        
-        # Second pass: batch process collected files
-        batch_size = 16  
-        print(f"Found {len(files_to_process)} files to index, processing in batches of {batch_size}")
-        
-        for i in range(0, len(files_to_process), batch_size):
-            batch = files_to_process[i:i + batch_size]
-            batch_indexed = await process_image_batch(batch, embedding_store)
-            indexed_count += batch_indexed
-            
-            # Update progress
-            batch_end = min(i + batch_size, len(files_to_process))
-            await manager.broadcast({
-                "type": "indexing_progress",
-                "folder": folder_path,
-                "current_file": f"Batch {i//batch_size + 1}",
-                "processed": batch_end,
-                "total": len(files_to_process),
-                "percentage": round((batch_end / len(files_to_process) * 100), 2) if len(files_to_process) > 0 else 0
-            })
-    
-            await asyncio.sleep(0.01)
-        
+
+        worker = run_on_indexing_thread(
+            partial(run_indexing_job, folder_path, job, emit=channel.emit, control=control, stop=stop),
+        )
+        worker.add_done_callback(lambda _: channel.close())
+        try:
+            while True:
+                message = await channel.get()
+                if message is None:
+                    break
+                state.update_indexing_progress(message["current_file"], message["processed"], message["total"])
+                if control is not None:
+                    control.update_progress(message["current_file"], message["processed"], message["total"])
+                await manager.broadcast(message)
+            result = await worker
+        except asyncio.CancelledError:
+            # The thread cannot be interrupted; ask it to stop at the next batch
+            # and drop whatever it ends with
+            stop.set()
+            worker.add_done_callback(lambda future: future.cancelled() or future.exception())
+            raise
+
         # Set indexing status to completed
         state.set_indexing_status(False, folder_path)
-        
-        elapsed_time = time.time() - start_time
-        
+
         # Broadcast completion notification
+        indexed_count = result["indexed_count"]
+        skipped_count = result["skipped_count"]
+        rejected_count = result["rejected_count"]
         await manager.broadcast({
             "type": "indexing_completed",
             "folder": folder_path,
+            "job_id": job_id,
             "total_indexed": indexed_count,
+            "rejected": rejected_count,
             "timestamp": __import__('datetime').datetime.now().isoformat(),
-            "message": f"Indexing complete for {os.path.basename(folder_path)}. Added: {indexed_count}, Skipped: {skipped_count} (already in database). You can now search for images."
+            "message": f"Indexing complete for {os.path.basename(folder_path)}. Added: {indexed_count}, Skipped: {skipped_count} (already in database), Rejected: {rejected_count} (icons or too small). You can now search for images."
         })
-        
-        print(f"Indexing completed for {folder_path}. Added: {indexed_count}, Skipped: {skipped_count} (already in database) - Time taken: {elapsed_time:.2f}s")
-        
+
     except Exception as e:
         elapsed_time = time.time() - start_time
         error_msg = f"Error indexing folder {folder_path}: {str(e)} - Time taken: {elapsed_time:.2f}s"
         print(error_msg)
         state.set_indexing_status(False, folder_path, error_msg)
+        embedding_store.update_job(job_id, state="failed", error=error_msg)
         await manager.broadcast({
             "type": "indexing_error",
             "folder": folder_path,
+            "job_id": job_id,
             "error": error_msg,
             "timestamp": __import__('datetime').datetime.now().isoformat()
         })
-        
+
         raise
 
 def process_image_batch_sync(file_paths: list, store: EmbeddingStore) -> int:
     if not file_paths:
         return 0
-    
-    indexed_count = 0
-    batch_images = []
-    valid_paths = []
-    
-    # Load all images in the batch
-    for file_path in file_paths:
-        try:
-            image = Image.open(file_path)
-            processed_image = preprocess(image)
-            batch_images.append(processed_image)
-            valid_paths.append(file_path)
-        except Exception as e:
-            print(f"Error loading image {file_path}: {e}")
-            continue
-    
-    if not batch_images:
-        return 0
-    
-    try:
-        # Stack images into a batch tensor
-        batch_tensor = torch.stack(batch_images).to(device)
-        
-        # Process entire batch with CLIP model
-        with torch.no_grad():
-            batch_embeddings = model.encode_image(batch_tensor).cpu().numpy()
-        
-        # Store embeddings in database
-        for i, (file_path, embedding) in enumerate(zip(valid_paths, batch_embeddings)):
-            try:
-                # Reshape embedding to match expected format
-                embedding_reshaped = embedding.reshape(1, -1)
-                if store.store_embedding(file_path, embedding_reshaped):
-                    indexed_count += 1
-                    print(f"Indexed: {file_path}")
-            except Exception as e:
-                print(f"Error storing embedding for {file_path}: {e}")
-    
-    except Exception as e:
-        print(f"Error processing batch: {e}")
-        # Fallback to individual processing if batch fails
-        for file_path in valid_paths:
-            try:
-                image = preprocess(Image.open(file_path)).unsqueeze(0).to(device)
-                with torch.no_grad():
-                    embedding = model.encode_image(image).cpu().numpy()
-                if store.store_embedding(file_path, embedding):
-                    indexed_count += 1
-                    print(f"Indexed (fallback): {file_path}")
-            except Exception as fallback_e:
-                print(f"Error in fallback processing {file_path}: {fallback_e}")
-    
-    return indexed_count
+    batch_pipeline = pipeline if store is embedding_store else \
+        IndexingPipeline(store, preprocess, encode_images, pipeline.batch_size)
+    return batch_pipeline.run(file_paths, batch_size=len(file_paths))["indexed_count"]
 
 def index_folder(folder_path: str):
-    start_time = time.time()
-    print(f"Indexing folder: {folder_path}")
-    indexed_count = 0
-    skipped_count = 0
-    files_to_process = []
-    for root, dirs, files in os.walk(folder_path):
-        for file_name in files:
-            if file_name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-                full_path = os.path.join(root, file_name)
-                
-                if embedding_store.needs_reindexing(full_path):
-                    files_to_process.append(full_path)
-                else:
-                    skipped_count += 1
-    batch_size = 16
-    print(f"Found {len(files_to_process)} files to index, processing in batches of {batch_size}")
-    
-    for i in range(0, len(files_to_process), batch_size):
-        batch = files_to_process[i:i + batch_size]
-        batch_indexed = process_image_batch_sync(batch, embedding_store)
-        indexed_count += batch_indexed
-    
-    elapsed_time = time.time() - start_time
-    print(f"Indexing completed. Added: {indexed_count}, Skipped: {skipped_count} (already in database) - Time taken: {elapsed_time:.2f}s")
+    """Index a folder synchronously on the calling thread, recorded as a job."""
+    job_id = embedding_store.create_job(folder_path)
+    try:
+        run_indexing_job(folder_path, embedding_store.get_job(job_id))
+    except Exception as e:
+        embedding_store.update_job(job_id, state="failed", error=str(e))
+        raise
 
-def search_images(query_text: str, request: Request):
+def search_images(query_text: str, request: Request, folder: Optional[str] = None):
     # Given a query text, compute its embedding, then find the top 5 most
-    # similar images from our persistent embeddings store.
+    # similar images from our persistent embeddings store, optionally only
+    # those under one folder.
     try:
         # Quick check - try to get first embedding to see if store is empty
-        has_embeddings = any(True for _ in embedding_store.get_all_embeddings())
+        has_embeddings = any(True for _ in embedding_store.get_all_embeddings(folder))
         if not has_embeddings:
             return []
     except Exception as e:
@@ -336,7 +341,7 @@ def search_images(query_text: str, request: Request):
     # Calculate cosine similarity
     similarities = {}
     try:
-        for image_path, embedding in embedding_store.get_all_embeddings():
+        for image_path, embedding in embedding_store.get_all_embeddings(folder):
             # embedding shape: (1, 512); text_features shape: (1, 512)
             cosine_sim = np.dot(text_features, embedding.T) / (
                 np.linalg.norm(text_features) * np.linalg.norm(embedding)
@@ -351,6 +356,11 @@ def search_images(query_text: str, request: Request):
                             key=lambda x: x[1], reverse=True)[:5]
 
     # Format results
+    try:
+        file_hashes = embedding_store.get_file_hashes([path for path, _ in sorted_results])
+    except Exception as e:
+        print(f"Error loading thumbnail ids: {e}")
+        file_hashes = {}
     results = []
     for path, score in sorted_results:
         # Convert cosine (−1…+1) → percentile (0…1)
@@ -386,9 +396,11 @@ def search_images(query_text: str, request: Request):
         unix_path = relative_path.replace(os.sep, "/")
         safe_path = quote(unix_path)
         full_url = f"{request.base_url}images/{safe_path}"
+        file_hash = file_hashes.get(path)
         results.append({
             "path": path,
             "score": float(percentile),
-            "full_url": full_url
+            "full_url": full_url,
+            "thumbnail_url": f"{request.base_url}thumbnails/{file_hash}" if file_hash else None
         })
     return results
@@ -0,0 +1,50 @@
+from PIL import Image
+
+# CLIP ViT-B/32 input resolution
+TARGET_SIZE = 224
+
+# Upper bound on pixels actually decoded for one image (~64 MP, ~192 MB as RGB).
+# Checked after draft mode, so huge JPEGs that can be DCT-scaled still load.
+MAX_DECODED_PIXELS = 64_000_000
+
+# Non-JPEG images are box-reduced until the short side is about this many
+# times the target, leaving the final bicubic resize enough pixels to
+# antialias properly.
+REDUCE_MARGIN = 2
+
+# Modes Image.reduce cannot handle (palette, bilevel, 16-bit)
+_NO_REDUCE_MODES = {"1", "P", "I;16", "I;16B", "I;16L"}
+
+# Formats decoded by the JPEG plugin and so able to draft; most phone
+# cameras write MPO (a JPEG with extra frames), which Pillow reports as such
+_DRAFT_FORMATS = {"JPEG", "MPO"}
+
+
+def open_image(file_path: str, target_size: int = TARGET_SIZE) -> Image.Image:
+    """
+    Open an image for embedding, decoding no more pixels than needed.
+
+    JPEGs are decoded at a reduced DCT scale (1/2, 1/4 or 1/8) so the result
+    is still at least ``target_size`` on both sides. Other formats are fully
+    decoded and then cheaply box-reduced before preprocessing resizes them.
+    Raises ``Image.DecompressionBombError`` for images that would decode to
+    more than ``MAX_DECODED_PIXELS``.
+    """
+    image = Image.open(file_path)
+
+    if image.format in _DRAFT_FORMATS:
+        # Only the header has been read so far; draft changes the decode scale
+        image.draft("RGB", (target_size, target_size))
+
+    width, height = image.size
+    if width * height > MAX_DECODED_PIXELS:
+        image.close()
+        raise Image.DecompressionBombError(
+            f"Image size ({width}x{height}) exceeds limit of {MAX_DECODED_PIXELS} pixels"
+        )
+
+    factor = min(width, height) // (target_size * REDUCE_MARGIN)
+    if factor >= 2 and image.mode not in _NO_REDUCE_MODES:
+        image = image.reduce(factor)
+
+    return image
@@ -0,0 +1,86 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+# Smallest images worth embedding; icons, emoji and UI sprites fall below these
+MIN_IMAGE_WIDTH = 64
+MIN_IMAGE_HEIGHT = 64
+MIN_FILE_BYTES = 2048
+
+# Banners, separators and sprite strips
+MAX_ASPECT_RATIO = 8.0
+
+# Full-path globs for directories that hold application artwork, not photos
+DEFAULT_IGNORE_GLOBS = (
+    "*/icons/*",
+    "*/pixmaps/*",
+    "*/emoji*/*",
+    "*/emoticons/*",
+    "*/sprites/*",
+    "*/favicon*",
+    "*/site-packages/*",
+    "*/node_modules/*",
+)
+
+HEADER_WORKERS = 8
+
+
+class IngestionPolicy:
+    """
+    Decide, before any decoding, whether a file is worth indexing.
+
+    Path globs and the byte size (from the stat signature when the scan
+    already has it) are checked first; only files that pass are opened, and
+    then only their header is read through PIL's lazy open to get the
+    dimensions. ``check`` returns the reason a file is rejected, or None.
+    """
+
+    def __init__(self, min_width: int = MIN_IMAGE_WIDTH, min_height: int = MIN_IMAGE_HEIGHT,
+                 min_bytes: int = MIN_FILE_BYTES, max_aspect_ratio: float = MAX_ASPECT_RATIO,
+                 ignore_globs: Iterable[str] = DEFAULT_IGNORE_GLOBS):
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_bytes = min_bytes
+        self.max_aspect_ratio = max_aspect_ratio
+        self.ignore_globs = tuple(ignore_globs)
+
+    def check(self, file_path: str, signature: Optional[Tuple[int, int, int]] = None) -> Optional[str]:
+        normalized = file_path.replace("\\", "/")
+        if any(fnmatch(normalized, pattern) for pattern in self.ignore_globs):
+            return "ignored_path"
+        try:
+            size = signature[0] if signature is not None else os.path.getsize(file_path)
+        except OSError:
+            return None
+        if size < self.min_bytes:
+            return "too_small_bytes"
+
+        try:
+            with Image.open(file_path) as image:
+                width, height = image.size
+        except Exception:
+            # Unreadable files are left to the decoder, which quarantines them
+            return None
+
+        if width < self.min_width or height < self.min_height:
+            return "too_small_dimensions"
+        if max(width, height) / max(1, min(width, height)) > self.max_aspect_ratio:
+            return "extreme_aspect_ratio"
+        return None
+
+    def screen(self, file_paths: List[str],
+               signatures: Optional[Dict[str, Optional[Tuple[int, int, int]]]] = None) -> Tuple[List[str], Counter]:
+        """Split file_paths into those to index and a Counter of rejection reasons."""
+        if not file_paths:
+            return file_paths, Counter()
+        signatures = signatures or {}
+        with ThreadPoolExecutor(max_workers=HEADER_WORKERS) as pool:
+            reasons = list(pool.map(lambda path: self.check(path, signatures.get(path)), file_paths))
+
+        accepted = [path for path, reason in zip(file_paths, reasons) if reason is None]
+        rejected = Counter(reason for reason in reasons if reason is not None)
+        return accepted, rejected
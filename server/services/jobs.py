@@ -0,0 +1,217 @@
+import asyncio
+import threading
+from typing import Dict, List, Optional
+
+import state as state
+from .embeddings import index_folder_async, embedding_store, manager
+from .worker import CPU_BUDGET, MAX_CONCURRENT_JOBS
+
+ACTIVE_STATES = ("queued", "running", "paused")
+
+
+class IndexingJob:
+    """In-memory handle for one folder indexing job, mirrored in indexing_jobs."""
+
+    def __init__(self, job_id: int, folder_path: str):
+        self.id = job_id
+        self.folder_path = folder_path
+        self.state = "queued"
+        self.progress = {
+            "current_file": None,
+            "processed_count": 0,
+            "total_count": 0,
+            "percentage": 0.0,
+        }
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+        self.started = False
+        self.decode_workers: Optional[int] = None
+        # Whether the job holds one of JobManager's slots; a job paused
+        # mid-run gives its slot back so queued jobs can start
+        self.holds_slot = False
+        self._reacquire: Optional[asyncio.Task] = None
+        # A threading.Event so the indexing thread can block on it directly
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+
+    async def wait_if_paused(self):
+        """Wait on the event loop until the job is not paused."""
+        while not self._unpaused.is_set():
+            await asyncio.sleep(0.2)
+
+    def block_while_paused(self, stop: Optional[threading.Event] = None):
+        """Called by the indexing thread between batches; blocks while the job is paused."""
+        while not self._unpaused.wait(timeout=0.2):
+            if stop is not None and stop.is_set():
+                return
+
+    def update_progress(self, current_file: Optional[str], processed: int, total: int):
+        self.progress["current_file"] = current_file
+        self.progress["processed_count"] = processed
+        self.progress["total_count"] = total
+        self.progress["percentage"] = round(processed / total * 100, 2) if total > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "folder": self.folder_path,
+            "state": self.state,
+            "progress": dict(self.progress),
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Queue of folder indexing jobs. Up to MAX_CONCURRENT_JOBS run at once and
+    split the CPU budget between their decode pools; the rest wait their turn.
+    Jobs can be paused, resumed and cancelled by id.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_JOBS):
+        self.max_concurrent = max_concurrent
+        self.decode_workers = max(1, CPU_BUDGET // max_concurrent)
+        self.jobs: Dict[int, IndexingJob] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def submit(self, folder_path: str, job_id: int = None, paused: bool = False) -> IndexingJob:
+        """Queue a folder for indexing. Pass job_id to resume an interrupted job."""
+        if self._slots is None:
+            # Created lazily so it binds to the running event loop
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        existing = self.find_active(folder_path)
+        if existing is not None:
+            return existing
+
+        if job_id is None:
+            job_id = embedding_store.create_job(folder_path, state="queued")
+        else:
+            embedding_store.update_job(job_id, state="queued")
+
+        job = IndexingJob(job_id, folder_path)
+        job.decode_workers = self.decode_workers
+        if paused:
+            job.state = "paused"
+            job._unpaused.clear()
+            embedding_store.update_job(job_id, state="paused")
+        self.jobs[job_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def _run(self, job: IndexingJob):
+        try:
+            while True:
+                await job.wait_if_paused()
+                await self._slots.acquire()
+                if job._unpaused.is_set():
+                    break
+                # Paused while waiting for the slot
+                self._slots.release()
+            job.holds_slot = True
+            try:
+                job.started = True
+                if job.state == "queued":
+                    job.state = "running"
+                await index_folder_async(job.folder_path, job_id=job.id, control=job)
+            finally:
+                if job._reacquire is not None:
+                    job._reacquire.cancel()
+                self._release(job)
+            job.state = "completed"
+        except asyncio.CancelledError:
+            if job.cancel_requested:
+                job.state = "cancelled"
+                embedding_store.update_job(job.id, state="cancelled")
+                state.set_indexing_status(False)
+                await manager.broadcast({
+                    "type": "indexing_cancelled",
+                    "folder": job.folder_path,
+                    "job_id": job.id,
+                })
+            else:
+                # Server shutdown: leave the job resumable on next startup
+                raise
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+
+    def get(self, job_id: int) -> Optional[IndexingJob]:
+        return self.jobs.get(job_id)
+
+    def find_active(self, folder_path: str) -> Optional[IndexingJob]:
+        for job in self.jobs.values():
+            if job.folder_path == folder_path and job.state in ACTIVE_STATES:
+                return job
+        return None
+
+    def list(self) -> List[dict]:
+        return [job.to_dict() for job in self.jobs.values()]
+
+    def has_active(self) -> bool:
+        return any(job.state in ACTIVE_STATES for job in self.jobs.values())
+
+    async def pause(self, job_id: int) -> IndexingJob:
+        job = self._require(job_id)
+        if job.state in ("queued", "running"):
+            job._unpaused.clear()
+            job.state = "paused"
+            embedding_store.update_job(job_id, state="paused")
+            if job._reacquire is not None:
+                job._reacquire.cancel()
+                job._reacquire = None
+            # The job's own indexing thread (see run_on_indexing_thread) waits
+            # between batches; only the slot is handed on
+            self._release(job)
+            await manager.broadcast({"type": "indexing_paused", "folder": job.folder_path, "job_id": job_id})
+        return job
+
+    async def resume(self, job_id: int) -> IndexingJob:
+        job = self._require(job_id)
+        if job.state == "paused":
+            job.state = "queued"
+            embedding_store.update_job(job_id, state="queued")
+            if job.started:
+                # Carries on once a slot is free again
+                job._reacquire = asyncio.create_task(self._reacquire_slot(job))
+            else:
+                job._unpaused.set()
+            await manager.broadcast({"type": "indexing_resumed", "folder": job.folder_path, "job_id": job_id})
+        return job
+
+    async def cancel(self, job_id: int) -> IndexingJob:
+        job = self._require(job_id)
+        if job.state in ACTIVE_STATES and job.task is not None:
+            job.cancel_requested = True
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+        return job
+
+    async def _reacquire_slot(self, job: IndexingJob):
+        await self._slots.acquire()
+        if job.state != "queued" or job.task is None or job.task.done():
+            self._slots.release()
+            return
+        job.holds_slot = True
+        job._reacquire = None
+        job.state = "running"
+        embedding_store.update_job(job.id, state="running")
+        job._unpaused.set()
+
+    def _release(self, job: IndexingJob):
+        if job.holds_slot:
+            job.holds_slot = False
+            self._slots.release()
+
+    def _require(self, job_id: int) -> IndexingJob:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+
+job_manager = JobManager()
@@ -0,0 +1,277 @@
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Rows rewritten per transaction by background migrations; small enough
+# that searches never wait long on the write lock
+MIGRATION_BATCH_SIZE = 500
+
+# Progress is printed at most this often
+MIGRATION_REPORT_INTERVAL = 5.0
+
+
+class Migration:
+    """
+    One numbered step of the EmbeddingStore schema.
+
+    ``apply`` makes the schema changes. It runs inside the transaction that
+    opens the store, so it must be quick, and it only ever runs once per
+    database. Migrations that rewrite existing rows set ``background`` and
+    implement ``count`` and ``run_batch``: MigrationRunner calls run_batch
+    with the cursor it returned last time until it returns None, saving
+    the cursor after every batch so an interrupted migration resumes where
+    it stopped. The rest of the store must work while the data is only
+    partly migrated.
+    """
+
+    version = 0
+    name = ""
+    background = False
+
+    def apply(self, conn) -> None:
+        pass
+
+    def count(self, store) -> int:
+        """Rows the background part will go through, for progress."""
+        return 0
+
+    def run_batch(self, store, cursor: Optional[str], batch_size: int) -> Tuple[Optional[str], int]:
+        """Process one batch after cursor; returns (next cursor or None when done, rows processed)."""
+        return None, 0
+
+
+class RawFloat32Embeddings(Migration):
+    """Rewrite pickled embedding blobs as raw float32 (see EMBEDDING_DTYPE)."""
+
+    version = 1
+    name = "raw_float32_embeddings"
+    background = True
+
+    tables = ("embeddings", "embedding_cache")
+
+    def count(self, store) -> int:
+        if not store.has_legacy_blobs():
+            return 0
+        return sum(store.count_rows(table) for table in self.tables)
+
+    def run_batch(self, store, cursor, batch_size):
+        if not store.has_legacy_blobs():
+            return None, 0
+        table, last_rowid = (cursor or f"{self.tables[0]}:0").split(":")
+        next_rowid, processed = store.convert_embedding_blobs(table, int(last_rowid), batch_size)
+        if next_rowid is not None:
+            return f"{table}:{next_rowid}", processed
+
+        position = self.tables.index(table)
+        if position + 1 < len(self.tables):
+            return f"{self.tables[position + 1]}:0", processed
+        store.mark_blobs_migrated()
+        return None, processed
+
+
+class FolderIndex(Migration):
+    """
+    Intern parent folders in a folders table and give every embedding the
+    id of its folder, indexed, so per-folder counts, deletes and filtered
+    searches are index range scans. file_path stays the key.
+    """
+
+    version = 2
+    name = "folder_index"
+    background = True
+
+    def apply(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+        if "folder_id" not in columns:
+            conn.execute("ALTER TABLE embeddings ADD COLUMN folder_id INTEGER REFERENCES folders(id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_folder ON embeddings(folder_id)")
+
+    def count(self, store) -> int:
+        return store.count_rows("embeddings")
+
+    def run_batch(self, store, cursor, batch_size):
+        next_rowid, processed = store.backfill_folder_ids(int(cursor or 0), batch_size)
+        if next_rowid is None:
+            store.mark_folder_index_ready()
+            return None, processed
+        return str(next_rowid), processed
+
+
+class JobSource(Migration):
+    """Record who runs each indexing job ('server' or 'cli'), so each resumes only its own."""
+
+    version = 3
+    name = "job_source"
+
+    def apply(self, conn):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(indexing_jobs)")}
+        if "source" not in columns:
+            conn.execute("ALTER TABLE indexing_jobs ADD COLUMN source TEXT NOT NULL DEFAULT 'server'")
+
+
+class DirectoryCacheListedAt(Migration):
+    """
+    Directory mtimes and subdirectories from the last complete scan of each
+    root, for incremental rescans (see scanner.TreeCache), with the time
+    each directory was listed so stale entries get listed again. Replaces
+    the listing hash the table used to hold; the old entries are only a
+    cache and are dropped.
+    """
+
+    version = 4
+    name = "directory_cache_listed_at"
+
+    def apply(self, conn):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(directory_cache)")}
+        if "listed_at" in columns:
+            return
+        conn.execute("DROP TABLE IF EXISTS directory_cache")
+        conn.execute("""
+            CREATE TABLE directory_cache (
+                dir_path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                listed_at REAL NOT NULL,
+                subdirs TEXT NOT NULL
+            )
+        """)
+
+
+class ReleaseEncodeQuarantine(Migration):
+    """
+    Let files quarantined for failing to encode be indexed again: only
+    decode failures are quarantined now, and an encode failure was most
+    likely a transient model or device error.
+    """
+
+    version = 5
+    name = "release_encode_quarantine"
+
+    def apply(self, conn):
+        conn.execute("DELETE FROM quarantine WHERE stage = 'encode'")
+
+
+class DropEmbeddingNames(Migration):
+    """
+    Databases from before the folder index settled on folder_id alone also
+    carry a name column (the file name within the folder) and an index on
+    (folder_id, name). Nothing reads them; they only duplicate file_path.
+    Swap the index for the folder_id one and null the names in batches.
+    """
+
+    version = 6
+    name = "drop_embedding_names"
+    background = True
+
+    def apply(self, conn):
+        conn.execute("DROP INDEX IF EXISTS idx_embeddings_folder_name")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_folder ON embeddings(folder_id)")
+
+    def count(self, store) -> int:
+        return store.count_rows("embeddings") if store.has_embedding_names() else 0
+
+    def run_batch(self, store, cursor, batch_size):
+        next_rowid, processed = store.clear_embedding_names(int(cursor or 0), batch_size)
+        if next_rowid is None:
+            return None, processed
+        return str(next_rowid), processed
+
+
+# In order; append new migrations with the next version number
+MIGRATIONS: List[Migration] = [
+    RawFloat32Embeddings(),
+    FolderIndex(),
+    JobSource(),
+    DirectoryCacheListedAt(),
+    ReleaseEncodeQuarantine(),
+    DropEmbeddingNames(),
+]
+
+
+class MigrationRunner:
+    """
+    Runs the background part of pending migrations, in version order, one
+    short transaction per batch. Progress is kept in the schema_version
+    table, so ``status`` is always current and a restart picks up from the
+    last saved cursor.
+    """
+
+    def __init__(self, store, migrations: List[Migration] = MIGRATIONS,
+                 batch_size: int = MIGRATION_BATCH_SIZE):
+        self.store = store
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def pending(self) -> List[Migration]:
+        records = {record["version"]: record for record in self.store.list_migrations()}
+        return [
+            migration for migration in self.migrations
+            if migration.background and records.get(migration.version, {}).get("state") != "completed"
+        ]
+
+    def run(self, pace: Optional[Callable[[], None]] = None,
+            stop: Optional[threading.Event] = None) -> bool:
+        """
+        Run pending migrations to completion. pace() is called between
+        batches and may sleep to yield to searches. Returns False if stopped
+        early or if another run is already in progress.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            for migration in self.pending():
+                if not self._run_one(migration, pace, stop):
+                    return False
+            return True
+        finally:
+            self._lock.release()
+
+    def _run_one(self, migration: Migration, pace, stop) -> bool:
+        record = self.store.get_migration(migration.version) or {}
+        cursor = record.get("cursor")
+        processed = record.get("processed_count") or 0
+        if record.get("state") != "running":
+            total = migration.count(self.store)
+            self.store.update_migration(migration.version, state="running", total_count=total)
+        else:
+            total = record.get("total_count") or 0
+        print(f"Running migration {migration.version} ({migration.name}): {processed}/{total} rows done")
+
+        last_report = time.monotonic()
+        while True:
+            if stop is not None and stop.is_set():
+                return False
+            cursor, batch_processed = migration.run_batch(self.store, cursor, self.batch_size)
+            processed += batch_processed
+            if cursor is None:
+                break
+            self.store.update_migration(migration.version, cursor=cursor, processed_count=processed)
+
+            if time.monotonic() - last_report >= MIGRATION_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                percent = processed / total * 100 if total else 100
+                print(f"Migration {migration.version} ({migration.name}): {processed}/{total} rows ({percent:.1f}%)")
+            if pace is not None:
+                pace()
+
+        self.store.update_migration(migration.version, state="completed", cursor=None,
+                                    processed_count=processed, completed=True)
+        print(f"Migration {migration.version} ({migration.name}) completed: {processed} rows")
+        return True
+
+    def status(self) -> List[dict]:
+        migrations = []
+        for record in self.store.list_migrations():
+            total = record["total_count"] or 0
+            done = record["state"] == "completed"
+            migrations.append({
+                **record,
+                "progress": 100.0 if done else round(record["processed_count"] / total * 100, 2) if total else 0.0,
+            })
+        return migrations
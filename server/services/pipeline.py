@@ -0,0 +1,447 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from .database import EmbeddingStore, stat_signature
+from .image_loading import open_image
+from .preprocessing import BatchPreprocessor
+from .ingestion import IngestionPolicy
+from .scanner import FolderScanner, TreeCache
+from .thumbnails import ThumbnailCache
+from .throttle import AdaptiveThrottle
+
+_DONE = object()
+
+# Scan results are diffed and filtered in chunks of this many files, or
+# whatever has arrived after this many seconds on slow mounts
+STREAM_CHUNK_SIZE = 256
+STREAM_REPORT_INTERVAL = 0.5
+
+
+class DecodeStage:
+    """
+    Decode and preprocess images on a thread pool ahead of the encoder.
+
+    Worker threads open and preprocess files and push the resulting tensors
+    into a bounded queue; the consumer groups them into stacked batches. The
+    queue bound keeps memory flat and makes workers wait when the encoder
+    falls behind.
+
+    Yielded batch tensors may share one reusable buffer, so each batch must
+    be consumed before the next one is requested.
+
+    ``metadata`` ({file_path: (signature, file_hash)}, see
+    ``EmbeddingStore.reuse_cached_embeddings``) supplies known content
+    hashes as thumbnail ids.
+    """
+
+    def __init__(self, preprocess: Callable, workers: int = None, queue_size: int = 64,
+                 on_error: Optional[Callable[[str, Exception], None]] = None,
+                 thumbnails: Optional[ThumbnailCache] = None,
+                 throttle: Optional[AdaptiveThrottle] = None,
+                 metadata: Optional[Dict[str, tuple]] = None):
+        self.preprocess = preprocess
+        self.metadata = metadata if metadata is not None else {}
+        self.on_error = on_error
+        self.thumbnails = thumbnails
+        self.throttle = throttle
+        self.workers = workers or min(8, os.cpu_count() or 2)
+        self.queue_size = queue_size
+        self.completed = 0  # files taken off the queue, including failed ones
+        try:
+            self.batch_preprocess = BatchPreprocessor.from_transform(preprocess)
+        except ValueError as e:
+            print(f"Batched preprocessing unavailable, using per-image transform: {e}")
+            self.batch_preprocess = None
+
+    def load(self, file_path: str):
+        image = open_image(file_path)
+        if self.thumbnails is not None:
+            # Reuse this decode for the result-grid thumbnail
+            try:
+                self.thumbnails.save(file_path, image, self.metadata.get(file_path, (None, None))[1])
+            except Exception as e:
+                print(f"Error creating thumbnail for {file_path}: {e}")
+        if self.batch_preprocess is None:
+            return self.preprocess(image)
+        # Geometry only; normalization happens once per batch
+        return self.batch_preprocess.prepare(image)
+
+    def _collate(self, items: list) -> torch.Tensor:
+        if self.batch_preprocess is None:
+            return torch.stack(items)
+        return self.batch_preprocess(items)
+
+    def batches(self, file_paths: Iterable[str], batch_size: int) -> Iterator[Tuple[List[str], torch.Tensor]]:
+        ready = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        # Bounds decodes in flight plus decoded items waiting in the queue
+        slots = threading.BoundedSemaphore(self.queue_size + self.workers)
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def decode(file_path):
+            if stop.is_set():
+                return
+            if self.throttle is not None:
+                # Shared limit across jobs, lowered while searches are slow
+                self.throttle.acquire()
+            try:
+                put((file_path, self.load(file_path), None))
+            except Exception as e:
+                put((file_path, None, e))
+            finally:
+                if self.throttle is not None:
+                    self.throttle.release()
+
+        feed_errors = []
+
+        def feed(pool):
+            try:
+                for file_path in file_paths:
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    pool.submit(decode, file_path)
+            except Exception as e:
+                # file_paths may be a lazy scan; hand its failure to the consumer
+                feed_errors.append(e)
+            finally:
+                # A lazy scan left suspended would be finalized later on
+                # whichever thread collects it, away from its connection
+                close = getattr(file_paths, "close", None)
+                if close is not None:
+                    try:
+                        close()
+                    except Exception as e:
+                        print(f"Error closing file source: {e}")
+                pool.shutdown(wait=True)
+                put(_DONE)
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="decode")
+        feeder = threading.Thread(target=feed, args=(pool,), name="decode-feeder", daemon=True)
+        feeder.start()
+
+        batch_paths, batch_items = [], []
+        try:
+            while True:
+                item = ready.get()
+                if item is _DONE:
+                    break
+                slots.release()
+                self.completed += 1
+
+                file_path, tensor, error = item
+                if error is not None:
+                    print(f"Error loading image {file_path}: {error}")
+                    if self.on_error is not None:
+                        self.on_error(file_path, error)
+                    continue
+
+                batch_paths.append(file_path)
+                batch_items.append(tensor)
+                if len(batch_paths) >= batch_size:
+                    yield batch_paths, self._collate(batch_items)
+                    batch_paths, batch_items = [], []
+
+            if batch_paths:
+                yield batch_paths, self._collate(batch_items)
+            if feed_errors:
+                raise feed_errors[0]
+        finally:
+            stop.set()
+            feeder.join()
+
+
+class EmbeddingWriter:
+    """
+    Persist encoded batches on a background thread so database writes
+    overlap with decoding and inference of the following batches.
+
+    Each batch is written in a single transaction. Signatures and hashes
+    found in ``metadata`` are used (and removed) instead of re-reading the
+    files.
+    """
+
+    def __init__(self, store: EmbeddingStore, queue_size: int = 4, verbose: bool = True,
+                 metadata: Optional[Dict[str, tuple]] = None):
+        self.store = store
+        self.verbose = verbose
+        self.metadata = metadata if metadata is not None else {}
+        self.indexed_count = 0
+        self.processed_count = 0  # rows attempted, stored or not
+        self.failed: List[str] = []  # paths of batches that could not be stored
+        self.last_written: Optional[str] = None
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="embedding-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is _DONE:
+                return
+            paths, embeddings = item
+            rows = [
+                (file_path, embedding.reshape(1, -1), *self.metadata.pop(file_path, (None, None)))
+                for file_path, embedding in zip(paths, embeddings)
+            ]
+            try:
+                stored = self.store.store_embeddings_bulk(rows)
+            except Exception as e:
+                print(f"Error storing batch of {len(rows)} embeddings: {e}")
+                stored = 0
+            if not stored:
+                self.failed.extend(paths)
+            elif self.verbose:
+                for file_path in paths:
+                    print(f"Indexed: {file_path}")
+            self.indexed_count += stored
+            self.processed_count += len(rows)
+            if rows:
+                self.last_written = rows[-1][0]
+
+    def submit(self, paths: List[str], embeddings: np.ndarray):
+        self._pending.put((paths, embeddings))
+
+    def close(self) -> int:
+        """Wait for queued writes to finish and return how many rows were stored."""
+        self._pending.put(_DONE)
+        self._thread.join()
+        return self.indexed_count
+
+
+class BisectingEncoder:
+    """
+    Encode a batch with ``encode`` (tensor -> embeddings). When the batch
+    fails, split it in half and retry each half, so one bad item costs
+    about log2(batch) extra forward passes instead of a pass per image.
+    Items that still fail on their own are dropped and passed to
+    ``on_failure``.
+    """
+
+    def __init__(self, encode: Callable[[torch.Tensor], np.ndarray],
+                 on_failure: Optional[Callable[[str, Exception], None]] = None):
+        self.encode = encode
+        self.on_failure = on_failure
+
+    def __call__(self, paths: List[str], batch: torch.Tensor) -> Tuple[List[str], np.ndarray]:
+        try:
+            return list(paths), self.encode(batch)
+        except Exception as e:
+            if len(paths) == 1:
+                print(f"Error encoding {paths[0]}: {e}")
+                if self.on_failure is not None:
+                    self.on_failure(paths[0], e)
+                return [], np.empty((0, 0), dtype=np.float32)
+            print(f"Error encoding batch of {len(paths)}, splitting: {e}")
+
+        middle = len(paths) // 2
+        left_paths, left = self(paths[:middle], batch[:middle])
+        right_paths, right = self(paths[middle:], batch[middle:])
+        parts = [part for part in (left, right) if len(part)]
+        embeddings = np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+        return left_paths + right_paths, embeddings
+
+
+class IndexingPipeline:
+    """
+    The one indexing path used by folder jobs, the default folder and the
+    watcher: scan -> filter -> decode/preprocess -> encode -> persist.
+
+    Each stage is a method or attribute that can be swapped independently:
+    ``stream`` walks a folder and feeds candidates straight into decoding,
+    ``select`` and ``reuse_cached`` filter out work already done, ``screen``
+    drops files the ingestion policy rejects from their path, size or image
+    header, ``decoder_class`` decodes and preprocesses on a thread pool,
+    ``encoder`` runs the model (bisecting failed batches) and
+    ``writer_class`` persists rows on a background thread. With a
+    ``thumbnails`` cache, the decode stage also writes each file's thumbnail
+    from the image it already decoded, and with a ``throttle`` decoding
+    shares its adaptive concurrency limit.
+
+    Files that fail to decode are quarantined in the store and filtered out
+    of later runs until their stat signature changes. Encode failures are
+    not: the input was already a valid tensor, so the cause is almost
+    always the model or device, and the file is retried on the next run.
+    """
+
+    decoder_class = DecodeStage
+    writer_class = EmbeddingWriter
+
+    def __init__(self, store: EmbeddingStore, preprocess: Callable,
+                 encode: Callable[[torch.Tensor], np.ndarray],
+                 batch_size: Callable[[], int], thumbnails: Optional[ThumbnailCache] = None,
+                 policy: Optional[IngestionPolicy] = None, throttle: Optional[AdaptiveThrottle] = None):
+        self.store = store
+        self.throttle = throttle
+        self.policy = policy or IngestionPolicy()
+        self.thumbnails = thumbnails
+        self.preprocess = preprocess
+        self.encoder = BisectingEncoder(encode)
+        self.batch_size = batch_size
+
+    def stream(self, folder_path: str, stats: dict,
+               on_progress: Optional[Callable[[str, int], None]] = None,
+               stopped: Optional[Callable[[], bool]] = None,
+               tree_cache: Optional[TreeCache] = None,
+               metadata: Optional[Dict[str, tuple]] = None) -> Iterator[str]:
+        """
+        Walk folder_path and yield the files that need encoding as the walk
+        finds them. The scan output is diffed, filtered and reused from the
+        cache in small chunks, and the generator is pulled by the decode
+        stage's bounded queue, so memory stays flat however large the tree
+        is and encoding starts within seconds.
+
+        ``stats`` is updated in place (scanned, queued, skipped, rejected,
+        reused, deleted). on_progress(path, scanned) is called from the
+        consuming thread at most every STREAM_REPORT_INTERVAL seconds. When
+        ``stopped`` returns True the walk ends early; rows for deleted files
+        are only removed after a complete walk that listed every directory.
+        The generator holds a connection that must be closed on the thread
+        that iterates it, so close it there if you stop early. With a ``tree_cache`` the
+        walk skips directories unchanged since the last committed scan.
+        Pass the same ``metadata`` dict to ``run`` so the signatures and
+        hashes computed here are stored instead of recomputed.
+        """
+        folder_path = os.path.normpath(folder_path)
+        stats.update(scanned=0, queued=0, skipped=0, rejected=Counter(), reused=0, deleted=0)
+        session = self.store.begin_scan(folder_path)
+        scanner = FolderScanner(tree_cache=tree_cache)
+        chunk = {}
+        last_flush = last_report = time.monotonic()
+        try:
+            for file_path, signature in scanner.scan(folder_path):
+                chunk[file_path] = signature
+                stats["scanned"] = scanner.count
+
+                now = time.monotonic()
+                if len(chunk) >= STREAM_CHUNK_SIZE or now - last_flush >= STREAM_REPORT_INTERVAL:
+                    yield from self._filter_chunk(session, chunk, stats, metadata)
+                    chunk = {}
+                    last_flush = time.monotonic()
+                if on_progress is not None and now - last_report >= STREAM_REPORT_INTERVAL:
+                    last_report = now
+                    on_progress(file_path, scanner.count)
+                if stopped is not None and stopped():
+                    return
+
+            if chunk:
+                yield from self._filter_chunk(session, chunk, stats, metadata)
+            if scanner.errors:
+                # Files under a directory that could not be listed are not gone
+                print(f"Not removing deleted files under {folder_path}: "
+                      f"{len(scanner.errors)} directories could not be listed")
+                return
+            stats["deleted"] = session.finish(tree_cache.skipped if tree_cache is not None else ())
+            if stats["deleted"]:
+                print(f"Removed {stats['deleted']} embeddings for files no longer in {folder_path}")
+        finally:
+            session.close()
+
+    def _filter_chunk(self, session, chunk: dict, stats: dict, metadata: Optional[dict] = None) -> List[str]:
+        new_files, changed_files = session.diff(chunk)
+        candidates = sorted(new_files | changed_files)
+        quarantined = self.store.quarantined({path: chunk[path] for path in candidates}) if candidates else set()
+        candidates = [path for path in candidates if path not in quarantined]
+        stats["skipped"] += len(chunk) - len(candidates)
+
+        candidates, rejected = self.policy.screen(candidates, chunk)
+        stats["rejected"].update(rejected)
+
+        remaining, reused = self.reuse_cached(candidates, chunk, metadata)
+        stats["reused"] += reused
+        stats["queued"] += len(remaining)
+        return remaining
+
+    def select(self, file_paths: Iterable[str]) -> List[str]:
+        """Filter a plain list of paths down to those missing or out of date in the store."""
+        return self.skip_quarantined(self.store.files_needing_reindex(list(file_paths)))
+
+    def screen(self, file_paths: List[str], signatures: dict = None) -> Tuple[List[str], int]:
+        """Apply the ingestion policy; returns (files to index, number rejected)."""
+        accepted, rejected = self.policy.screen(file_paths, signatures)
+        if rejected:
+            details = ", ".join(f"{reason}: {count}" for reason, count in rejected.most_common())
+            print(f"Rejected {sum(rejected.values())} files before decoding ({details})")
+        return accepted, sum(rejected.values())
+
+    def skip_quarantined(self, file_paths: List[str], signatures: dict = None) -> List[str]:
+        """Drop files that failed before and have not changed since."""
+        if not file_paths:
+            return file_paths
+        if signatures is None:
+            signatures = {path: stat_signature(path) for path in file_paths}
+        quarantined = self.store.quarantined(signatures)
+        if quarantined:
+            print(f"Skipping {len(quarantined)} quarantined files")
+        return [path for path in file_paths if path not in quarantined]
+
+    def decode_failed(self, file_path: str, error: Exception):
+        self.store.quarantine_file(file_path, error, stage="decode")
+
+    def reuse_cached(self, file_paths: List[str], signatures: dict = None,
+                     metadata: dict = None) -> Tuple[List[str], int]:
+        """Fill in files whose content is already embedded; returns (still to encode, reused)."""
+        remaining = self.store.reuse_cached_embeddings(file_paths, signatures, metadata)
+        return remaining, len(file_paths) - len(remaining)
+
+    def run(self, file_paths: Iterable[str], batch_size: int = None, decode_workers: int = None,
+            on_batch: Optional[Callable[[int, DecodeStage, EmbeddingWriter], None]] = None,
+            metadata: Optional[Dict[str, tuple]] = None) -> dict:
+        """
+        Decode, encode and persist file_paths, which may be a lazy iterable
+        such as ``stream``. on_batch(number, decoder, writer) runs after each
+        batch is handed to the writer and may raise to stop. ``metadata`` is
+        the dict filled by ``stream`` or ``reuse_cached``.
+
+        ``unwritten`` in the result lists files that were decoded but have
+        no row, because encoding or the write failed; pass it to
+        ``TreeCache.commit`` so their directories are listed again.
+        """
+        decoder = self.decoder_class(self.preprocess, workers=decode_workers, on_error=self.decode_failed,
+                                     thumbnails=self.thumbnails, throttle=self.throttle, metadata=metadata)
+        writer = self.writer_class(self.store, metadata=metadata)
+        batches = decoder.batches(file_paths, batch_size or self.batch_size())
+        unwritten = []
+        try:
+            for number, (batch_paths, batch_tensor) in enumerate(batches, 1):
+                encoded_paths, embeddings = self.encoder(batch_paths, batch_tensor)
+                if len(encoded_paths) < len(batch_paths):
+                    unwritten.extend(set(batch_paths).difference(encoded_paths))
+                writer.submit(encoded_paths, embeddings)
+                if on_batch is not None:
+                    on_batch(number, decoder, writer)
+        finally:
+            batches.close()
+            writer.close()
+        return {
+            "indexed_count": writer.indexed_count,
+            "processed_count": writer.processed_count,
+            "last_written": writer.last_written,
+            "unwritten": unwritten + writer.failed,
+        }
+
+    def index_files(self, file_paths: Iterable[str]) -> int:
+        """Index individual files (default folder, watcher events); returns rows added."""
+        accepted, _ = self.screen(self.select(file_paths))
+        metadata = {}
+        remaining, reused = self.reuse_cached(accepted, metadata=metadata)
+        if not remaining:
+            return reused
+        return reused + self.run(remaining, metadata=metadata)["indexed_count"]
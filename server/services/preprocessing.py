@@ -0,0 +1,102 @@
+from typing import List, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms as T
+
+# Names used by current and older open_clip releases for RGB conversion and ToTensor
+_PASSTHROUGH_TRANSFORMS = {"_convert_to_rgb", "MaybeConvertMode", "ToTensor", "MaybeToTensor"}
+
+
+def _transform_name(t) -> str:
+    return getattr(t, "__name__", type(t).__name__)
+
+
+class BatchPreprocessor:
+    """
+    Batched equivalent of the open_clip image transform.
+
+    The geometric part (shortest-side bicubic resize, center crop, RGB
+    conversion) is done per image by ``prepare`` and yields a small uint8
+    array, which is what decode workers hand to the queue. ``__call__`` then
+    converts and normalizes a whole batch of those arrays into one reusable
+    float32 buffer using the same operations as ToTensor + Normalize, so the
+    result matches the per-image transform exactly.
+
+    The returned tensor is a view of the internal buffer and is overwritten
+    by the next call.
+    """
+
+    def __init__(self, resize_size, crop_size: Sequence[int],
+                 mean: Sequence[float], std: Sequence[float]):
+        self.resize_size = resize_size
+        self.crop_height, self.crop_width = crop_size
+        self._mean = torch.as_tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        self._std = torch.as_tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+        self._staging = None
+        self._buffer = None
+
+    @classmethod
+    def from_transform(cls, transform) -> "BatchPreprocessor":
+        """Read sizes and normalization constants from an open_clip/torchvision Compose."""
+        resize_size = crop_size = mean = std = None
+        for t in getattr(transform, "transforms", []):
+            if isinstance(t, T.Resize):
+                if t.max_size is not None or t.interpolation != T.InterpolationMode.BICUBIC:
+                    raise ValueError(f"Unsupported resize settings: {t}")
+                resize_size = t.size
+            elif isinstance(t, T.CenterCrop):
+                crop_size = tuple(t.size)
+            elif isinstance(t, T.Normalize):
+                mean, std = t.mean, t.std
+            elif _transform_name(t) in _PASSTHROUGH_TRANSFORMS and getattr(t, "mode", "RGB") == "RGB":
+                # RGB conversion and uint8 -> float scaling are built into prepare/__call__
+                continue
+            else:
+                raise ValueError(f"Unsupported transform: {t}")
+
+        if resize_size is None or crop_size is None or mean is None:
+            raise ValueError("Transform must contain Resize, CenterCrop and Normalize")
+        return cls(resize_size, crop_size, mean, std)
+
+    def _resized_dims(self, width: int, height: int):
+        # Mirrors torchvision.transforms.functional.resize
+        if isinstance(self.resize_size, int) or len(self.resize_size) == 1:
+            requested = self.resize_size if isinstance(self.resize_size, int) else self.resize_size[0]
+            short, long = (width, height) if width <= height else (height, width)
+            new_short, new_long = requested, int(requested * long / short)
+            return (new_short, new_long) if width <= height else (new_long, new_short)
+        new_height, new_width = self.resize_size
+        return new_width, new_height
+
+    def prepare(self, image: Image.Image) -> np.ndarray:
+        """Resize, center-crop and convert one image to an HxWx3 uint8 array."""
+        new_size = self._resized_dims(*image.size)
+        if new_size != image.size:
+            image = image.resize(new_size, Image.BICUBIC)
+
+        width, height = image.size
+        top = int(round((height - self.crop_height) / 2.0))
+        left = int(round((width - self.crop_width) / 2.0))
+        image = image.crop((left, top, left + self.crop_width, top + self.crop_height))
+
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.asarray(image, dtype=np.uint8)
+
+    def __call__(self, arrays: List[np.ndarray]) -> torch.Tensor:
+        """Normalize a list of prepared arrays into an (N, 3, H, W) float32 batch."""
+        n = len(arrays)
+        if self._buffer is None or self._buffer.shape[0] < n:
+            self._staging = np.empty((n, self.crop_height, self.crop_width, 3), dtype=np.uint8)
+            self._buffer = torch.empty((n, 3, self.crop_height, self.crop_width), dtype=torch.float32)
+
+        staging = self._staging[:n]
+        np.stack(arrays, out=staging)
+
+        batch = self._buffer[:n]
+        # Layout change and uint8 -> float32 conversion in a single copy
+        batch.copy_(torch.from_numpy(staging).permute(0, 3, 1, 2))
+        batch.div_(255).sub_(self._mean).div_(self._std)
+        return batch
@@ -0,0 +1,226 @@
+import os
+import queue
+import threading
+import time
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .database import EmbeddingStore, stat_signature
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# Directory names that never hold user photos worth indexing
+DEFAULT_IGNORE_PATTERNS = (
+    ".git", ".hg", ".svn",
+    "node_modules", "__pycache__", ".venv", "venv",
+    ".cache", ".thumbnails", ".Trash*", "$RECYCLE.BIN", "System Volume Information",
+)
+
+# Directories modified this recently are not cached: a file added later in
+# the same mtime tick would not change the directory's mtime again
+RACY_MTIME_SECONDS = 2.0
+
+# Cached directories are listed again after this long even if their mtime
+# did not move, so files rewritten in place while nothing was watching are
+# found by the signature diff within a week
+RELIST_AFTER_SECONDS = 7 * 24 * 3600
+
+_DONE = object()
+
+
+class TreeCache:
+    """
+    Per-directory mtime and subdirectories from the last complete scan of a
+    root, so a rescan can skip directories whose direct contents did not
+    change. Entries are loaded once per scan; new entries are only written
+    by ``commit``, after the files they describe have been indexed.
+
+    Adding, removing or renaming a file updates its directory's mtime, so
+    those are always seen. A file rewritten in place does not: the watcher
+    picks it up from its modify event, and otherwise it is found when its
+    directory's entry expires after RELIST_AFTER_SECONDS.
+    """
+
+    def __init__(self, store: EmbeddingStore, root: str):
+        self.store = store
+        # Same spelling as the paths the scanner builds, e.g. no trailing slash
+        self.root = os.path.normpath(root)
+        self.entries = store.load_directory_cache(self.root)
+        self.pending: List[Tuple[str, int, float, List[str]]] = []
+        self.skipped: List[str] = []
+
+    def lookup(self, path: str) -> Optional[Tuple[int, List[str]]]:
+        """(mtime_ns, subdir names) cached for path, or None if unknown or due for relisting."""
+        entry = self.entries.get(path)
+        if entry is None or time.time() - entry[1] > RELIST_AFTER_SECONDS:
+            return None
+        return entry[0], entry[2]
+
+    def record(self, path: str, mtime_ns: int, subdirs: List[str]):
+        now = time.time()
+        if now - mtime_ns / 1e9 < RACY_MTIME_SECONDS:
+            return
+        self.pending.append((path, mtime_ns, now, subdirs))
+
+    def commit(self, unwritten: Iterable[str] = ()):
+        """
+        Save the directories listed by this scan, except those holding any
+        of the ``unwritten`` files (see IndexingPipeline.run): a cached
+        directory is not listed again, so its failed files would never be
+        retried.
+        """
+        failed_dirs = {os.path.dirname(file_path) for file_path in unwritten}
+        rows = [row for row in self.pending if row[0] not in failed_dirs]
+        if rows:
+            self.store.save_directory_cache(rows)
+        self.pending = []
+
+
+class FolderScanner:
+    """
+    Walk a directory tree once, in parallel, yielding image files as found.
+
+    Directories are listed with os.scandir by a small pool of threads; each
+    listed subdirectory goes back on the work queue so independent subtrees
+    are read concurrently. Results stream out of ``scan`` as a generator
+    together with their stat signature, taken from the DirEntry (free on
+    Windows, one stat call elsewhere). ``count`` is a running total of files
+    yielded so far, for progress reporting while the scan is still going.
+    Directories that could not be listed are collected in ``errors``; the
+    walk carries on without them, so callers must not treat files under
+    them as deleted.
+
+    With a ``tree_cache``, a directory whose mtime matches the last scan is
+    not listed at all, unless its entry is due for relisting: its cached
+    subdirectories are visited and its files are not yielded. Skipped directories are collected in
+    ``tree_cache.skipped``. A directory whose mtime moved is listed and all
+    its files are yielded, even if the names are the same as before: a
+    save-to-temp-and-rename edit changes a file without changing the
+    listing, and the manifest diff sorts out what actually changed.
+    """
+
+    def __init__(self, extensions: Iterable[str] = IMAGE_EXTENSIONS,
+                 ignore_patterns: Iterable[str] = DEFAULT_IGNORE_PATTERNS,
+                 workers: int = 4, queue_size: int = 1024,
+                 tree_cache: Optional[TreeCache] = None):
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.tree_cache = tree_cache
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.count = 0
+        self.last_path: Optional[str] = None
+        self.errors: List[str] = []
+
+    def is_ignored(self, name: str) -> bool:
+        return any(fnmatch(name, pattern) for pattern in self.ignore_patterns)
+
+    def scan(self, root: str) -> Iterator[Tuple[str, Optional[Tuple[int, int, int]]]]:
+        """Yield (file_path, (size, mtime_ns, inode)) for every matching file under root."""
+        root = os.path.normpath(root)
+        directories = queue.Queue()
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        pending = [1]  # directories queued but not yet fully listed
+        pending_lock = threading.Lock()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def list_directory(path):
+            subdirs = []
+            try:
+                if self.tree_cache is not None:
+                    subdirs = list_cached(path)
+                    return
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if stop.is_set():
+                            return
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self.is_ignored(entry.name):
+                                    subdirs.append(entry.path)
+                            elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                                put((entry.path, stat_signature(entry.path, entry.stat())))
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"Error scanning directory {path}: {e}")
+                self.errors.append(path)
+            finally:
+                with pending_lock:
+                    pending[0] += len(subdirs) - 1
+                    finished = pending[0] == 0
+                for subdir in subdirs:
+                    directories.put(subdir)
+                if finished:
+                    # Last directory done: wake every worker so they exit
+                    for _ in range(self.workers):
+                        directories.put(_DONE)
+                    put(_DONE)
+
+        def list_cached(path):
+            """list_directory against the tree cache; returns the subdirectories to visit."""
+            cache = self.tree_cache
+            mtime_ns = os.stat(path).st_mtime_ns
+            cached = cache.lookup(path)
+            if cached is not None and cached[0] == mtime_ns:
+                cache.skipped.append(path)
+                return [os.path.join(path, name) for name in cached[1]]
+
+            files = []
+            subdir_names = []
+            with os.scandir(path) as it:
+                for entry in it:
+                    if stop.is_set():
+                        return []
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.is_ignored(entry.name):
+                                subdir_names.append(entry.name)
+                        elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                            files.append((entry.path, stat_signature(entry.path, entry.stat())))
+                    except OSError:
+                        continue
+
+            for item in files:
+                put(item)
+            cache.record(path, mtime_ns, subdir_names)
+            return [os.path.join(path, name) for name in subdir_names]
+
+        def worker():
+            while not stop.is_set():
+                path = directories.get()
+                if path is _DONE:
+                    return
+                list_directory(path)
+
+        threads = [
+            threading.Thread(target=worker, name=f"scanner-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        directories.put(root)
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                self.count += 1
+                self.last_path = item[0]
+                yield item
+        finally:
+            stop.set()
+            for _ in range(self.workers):
+                directories.put(_DONE)
+            for thread in threads:
+                thread.join()
+
@@ -0,0 +1,157 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import psutil
+
+# Indexing backs off while the recent search p95 is above this
+SEARCH_LATENCY_TARGET = 0.3  # seconds
+
+# Searches older than this no longer count as "users are active"
+LATENCY_WINDOW = 30.0  # seconds
+
+# Share of the CPU used by other processes above which indexing backs off
+CPU_BUSY_FRACTION = 0.75
+
+# Longest pause inserted between two indexing batches
+MAX_BATCH_DELAY = 2.0
+
+# How often the throttle re-reads latency and CPU load
+UPDATE_INTERVAL = 1.0
+
+# Niceness given to indexing threads (0 normal, 19 lowest)
+INDEXING_NICENESS = 10
+
+
+class LatencyTracker:
+    """Recent search latencies, for percentiles over a sliding time window."""
+
+    def __init__(self, window: float = LATENCY_WINDOW, max_samples: int = 1000):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, fraction: float = 0.95) -> Optional[float]:
+        """Latency at the given percentile over the window, or None if there were no searches."""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            latencies = sorted(seconds for _, seconds in self._samples)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+class AdaptiveThrottle:
+    """
+    Paces indexing so searches stay under SEARCH_LATENCY_TARGET.
+
+    Each ``pace`` call (once per batch) re-reads the search p95 and the CPU
+    time used by other processes at most every UPDATE_INTERVAL seconds. When
+    either is over budget the throttle halves how many images may be
+    decoded at once and doubles the pause between batches; when searches
+    are well under target (or idle) and the CPU has room it steps back up.
+    Decode workers of every running job share the concurrency limit through
+    ``acquire``/``release``.
+    """
+
+    def __init__(self, latency: LatencyTracker, target: float = SEARCH_LATENCY_TARGET,
+                 max_concurrency: int = None):
+        self.latency = latency
+        self.target = target
+        self.max_concurrency = max_concurrency or os.cpu_count() or 2
+        self.concurrency = self.max_concurrency
+        self.delay = 0.0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._process = psutil.Process()
+        self._cpu_count = psutil.cpu_count() or 1
+        self._last_update = 0.0
+        # Prime the counters; the first reading of cpu_percent is meaningless
+        psutil.cpu_percent(None)
+        self._process.cpu_percent(None)
+
+    def other_cpu_load(self) -> float:
+        """Fraction of total CPU used by everything except this server."""
+        total = psutil.cpu_percent(None) / 100.0
+        own = self._process.cpu_percent(None) / 100.0 / self._cpu_count
+        return max(0.0, total - own)
+
+    def update(self):
+        now = time.monotonic()
+        if now - self._last_update < UPDATE_INTERVAL:
+            return
+        self._last_update = now
+
+        p95 = self.latency.percentile(0.95)
+        cpu_busy = self.other_cpu_load() > CPU_BUSY_FRACTION
+        with self._condition:
+            if (p95 is not None and p95 > self.target) or cpu_busy:
+                self.concurrency = max(1, self.concurrency // 2)
+                self.delay = min(MAX_BATCH_DELAY, max(0.05, self.delay * 2))
+            elif p95 is None or p95 < self.target / 2:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.delay = self.delay / 2 if self.delay > 0.01 else 0.0
+            self._condition.notify_all()
+
+    def pace(self, stop: Optional[threading.Event] = None):
+        """Called by an indexing job between batches; sleeps for the current delay."""
+        self.update()
+        if self.delay > 0:
+            if stop is not None:
+                stop.wait(self.delay)
+            else:
+                time.sleep(self.delay)
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self.concurrency:
+                self._condition.wait(timeout=0.5)
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def status(self) -> dict:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "search_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "target_ms": self.target * 1000,
+            "concurrency": self.concurrency,
+            "max_concurrency": self.max_concurrency,
+            "batch_delay": round(self.delay, 3),
+        }
+
+
+def lower_thread_priority():
+    """
+    Give the calling thread a lower CPU and I/O priority. On Linux both are
+    per thread and inherited by threads it starts, so calling this at the
+    top of an indexing job covers its scanner, decode and writer threads.
+    Elsewhere it does nothing, since it would lower the whole server.
+    """
+    if not sys.platform.startswith("linux"):
+        return
+    thread_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, thread_id, INDEXING_NICENESS)
+    except (AttributeError, OSError) as e:
+        print(f"Could not lower indexing thread priority: {e}")
+    try:
+        psutil.Process(thread_id).ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (AttributeError, psutil.Error, OSError) as e:
+        print(f"Could not lower indexing thread I/O priority: {e}")
+
+
+search_latency = LatencyTracker()
+indexing_throttle = AdaptiveThrottle(search_latency)
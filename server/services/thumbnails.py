@@ -0,0 +1,71 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from .database import content_hash
+from .image_loading import open_image
+
+THUMBNAIL_DIR = Path("embeddings/thumbnails")
+
+# Longest side of a thumbnail, in pixels; sized for the result grid
+THUMBNAIL_SIZE = 256
+THUMBNAIL_QUALITY = 80
+
+_THUMBNAIL_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ThumbnailCache:
+    """
+    Content-addressed WebP thumbnails on disk.
+
+    A thumbnail's id is the MD5 of the original file, the same value stored
+    as file_hash in the embeddings table, so identical files share one
+    thumbnail and a file that changes gets a new id. Files are laid out as
+    ``<dir>/<id[:2]>/<id>.webp`` and written atomically.
+    """
+
+    media_type = "image/webp"
+
+    def __init__(self, directory: Path = THUMBNAIL_DIR, size: int = THUMBNAIL_SIZE,
+                 quality: int = THUMBNAIL_QUALITY):
+        self.directory = Path(directory)
+        self.size = size
+        self.quality = quality
+
+    def path_for(self, thumbnail_id: str) -> Optional[Path]:
+        if not _THUMBNAIL_ID.match(thumbnail_id):
+            return None
+        return self.directory / thumbnail_id[:2] / f"{thumbnail_id}.webp"
+
+    def save(self, file_path: str, image: Image.Image, thumbnail_id: Optional[str] = None) -> Optional[str]:
+        """
+        Write a thumbnail of an already decoded image and return its id.
+        Pass the file's content hash as thumbnail_id when it is already
+        known. The image is not modified.
+        """
+        thumbnail_id = thumbnail_id or content_hash(file_path)
+        if thumbnail_id is None:
+            return None
+        path = self.path_for(thumbnail_id)
+        if path.exists():
+            return thumbnail_id
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((self.size, self.size), Image.BICUBIC)
+        if thumbnail.mode not in ("RGB", "RGBA"):
+            thumbnail = thumbnail.convert("RGBA" if "transparency" in thumbnail.info else "RGB")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        thumbnail.save(temp_path, "WEBP", quality=self.quality)
+        os.replace(temp_path, path)
+        return thumbnail_id
+
+    def create(self, file_path: str) -> Optional[str]:
+        """Decode a file just for its thumbnail, for rows indexed without one."""
+        with open_image(file_path) as image:
+            return self.save(file_path, image)
@@ -1,34 +1,39 @@
 import os
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import numpy as np
-import torch
-from PIL import Image
-from services.embeddings import model, preprocess, embedding_store, device
+from services.embeddings import pipeline
 
 observers = []  
 
 
 class ImageFolderHandler(FileSystemEventHandler):
     def on_created(self, event):
-        if event.is_directory:
-            return  
-
-        ext = os.path.splitext(event.src_path)[1].lower()
+        if not event.is_directory:
+            self._index(event.src_path, "new")
+
+    def on_modified(self, event):
+        # A file rewritten in place does not change its directory's mtime,
+        # so rescans skip it (see scanner.TreeCache); catch it here
+        if not event.is_directory:
+            self._index(event.src_path, "modified")
+
+    def on_moved(self, event):
+        # Covers editors that save to a temporary file and rename it over
+        # the original
+        if not event.is_directory:
+            self._index(event.dest_path, "moved")
+
+    def _index(self, path, change):
+        ext = os.path.splitext(path)[1].lower()
         if ext in [".png", ".jpg", ".jpeg", ".webp"]:
-            print(f"[WATCHER] Detected new image: {event.src_path}")
-            # Check if we need to reindex this file
-            if embedding_store.needs_reindexing(event.src_path):
-                try:
-                    with torch.no_grad():
-                        image = preprocess(Image.open(event.src_path)).unsqueeze(0).to(device)
-                        embedding = model.encode_image(image).cpu().numpy()
-                        embedding /= np.linalg.norm(embedding, keepdims=True)
-                    
-                    if embedding_store.store_embedding(event.src_path, embedding):
-                        print(f"[WATCHER] Successfully embedded: {event.src_path}")
-                except Exception as e:
-                    print(f"[WATCHER] Error processing {event.src_path}: {e}")
+            print(f"[WATCHER] Detected {change} image: {path}")
+            # Same path as folder indexing: skip if up to date, reuse cached
+            # content, otherwise decode and encode
+            try:
+                if pipeline.index_files([path]):
+                    print(f"[WATCHER] Successfully embedded: {path}")
+            except Exception as e:
+                print(f"[WATCHER] Error processing {path}: {e}")
 
 
 def start_watcher(folder_path, embedding_store):
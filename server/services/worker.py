@@ -0,0 +1,66 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .throttle import lower_thread_priority
+
+# Share of the machine indexing may use, in cores
+CPU_BUDGET = os.cpu_count() or 2
+
+# Folders indexed at the same time; the rest wait in the queue
+MAX_CONCURRENT_JOBS = max(1, CPU_BUDGET // 4)
+
+def run_on_indexing_thread(fn) -> asyncio.Future:
+    """
+    Run fn on a new thread of its own and return a future for it on the
+    running loop. Folder indexing uses this instead of a shared pool: a job
+    paused mid-run parks its thread, and with a fixed pool enough paused
+    jobs would leave the job that took over their slot waiting for a
+    thread. Slots in JobManager are what bound how many run at once.
+
+    The thread runs at lower CPU and I/O priority than those serving
+    searches, and never occupies the event loop or the default executor
+    used by asyncio.to_thread.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexer",
+                                  initializer=lower_thread_priority)
+    try:
+        return asyncio.get_running_loop().run_in_executor(executor, fn)
+    finally:
+        # The submitted call still runs; the thread exits once it returns
+        executor.shutdown(wait=False)
+
+
+# Database maintenance (migrations, cleanup) gets its own threads so it never
+# queues behind indexing jobs, at the same low priority
+MAINTENANCE_WORKERS = 2
+maintenance_executor = ThreadPoolExecutor(
+    max_workers=MAINTENANCE_WORKERS, thread_name_prefix="maintenance", initializer=lower_thread_priority
+)
+
+
+class IndexingCancelled(Exception):
+    """Raised inside an indexing worker when its job was asked to stop."""
+
+
+class ProgressChannel:
+    """
+    Carries messages from an indexing worker thread to the event loop.
+
+    ``emit`` may be called from any thread; messages are queued on the loop
+    with call_soon_threadsafe and read back with ``get``. ``close`` marks the
+    end of the stream, after which ``get`` returns None.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(self, message: dict):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    async def get(self):
+        return await self.queue.get()